@@ -0,0 +1,296 @@
+"""
+Benchmark hors-ligne du pipeline default_firewall.
+
+Rejoue des PacketIn synthétiques (ou lus dans un fichier pcap) à travers
+AnalyticalFirewall + ARPFirewall + DOSFirewall, sans Docker, OVS ni Mininet.
+Les messages envoyés au switch sont comptés par une fausse connexion.
+
+Usage (depuis /pox) :
+  python3 pox.py bench_firewall --mix=all --packets=20000 log.level --ERROR
+  python3 pox.py bench_firewall --pcap=/tmp/pox/capture.pcap
+
+Mélanges de trafic : normal, arp_spoof, syn_flood, spoofed_ddos (ou all).
+Pour chaque mélange : paquets/s, temps par module, messages émis.
+"""
+import random
+import struct
+import time
+from collections import Counter
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+import pox.lib.util as poxutil
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.packet.ethernet import ethernet, ETHER_BROADCAST
+from pox.lib.packet.arp import arp
+from pox.lib.packet.ipv4 import ipv4
+from pox.lib.packet.tcp import tcp
+from pox.lib.packet.icmp import icmp, echo, TYPE_ECHO_REQUEST
+
+import default_firewall as dfw
+from fw.mitigation import MitigationRegistry
+
+log = core.getLogger()
+
+MIXES = ("normal", "arp_spoof", "syn_flood", "spoofed_ddos")
+
+# Hosts vus depuis switch2 (voir mininet/mini/topology.py) : IP -> (MAC, port)
+HOSTS = {
+    "10.0.2.10": ("00:00:00:00:02:10", 1),   # cli1
+    "10.0.2.11": ("00:00:00:00:02:11", 2),   # cli2
+    "10.0.2.20": ("00:00:00:00:02:20", 3),   # att
+    "10.0.2.1":  ("00:00:00:00:03:01", 4),   # router1 (passerelle vers srv)
+}
+CLIENTS = ("10.0.2.10", "10.0.2.11")
+ATTACKER = "10.0.2.20"
+GATEWAY = "10.0.2.1"
+SERVER = "10.0.1.10"
+
+
+class FakeConnection(object):
+    """Connexion OpenFlow factice : compte les messages (et octets) envoyés."""
+
+    def __init__(self, dpid):
+        self.dpid = dpid
+        self.disconnected = False
+        self.sent = Counter()
+        self.bytes = 0
+
+    def send(self, msg):
+        self.sent[type(msg).__name__] += 1
+        self.bytes += len(msg.pack())
+
+    def addListeners(self, *args, **kw):
+        pass
+
+    def addListenerByName(self, *args, **kw):
+        pass
+
+
+class FakePacketIn(object):
+    """PacketIn factice : le paquet n'est analysé qu'au premier accès (comme POX)."""
+
+    def __init__(self, connection, port, raw, buffer_id=None,
+                 miss_send_len=dfw.MISS_SEND_LEN):
+        self.connection = connection
+        self.dpid = connection.dpid
+        self.port = port
+        # Paquet en buffer : le switch n'envoie que les premiers octets
+        self.data = raw if buffer_id is None else raw[:miss_send_len]
+        self.ofp = of.ofp_packet_in(in_port=port, buffer_id=buffer_id,
+                                    reason=of.OFPR_NO_MATCH, data=self.data)
+        self.ofp.total_len = len(raw)
+        self._parsed = None
+
+    @property
+    def parsed(self):
+        if self._parsed is None:
+            self._parsed = ethernet(self.data)
+        return self._parsed
+
+
+class TimedModule(object):
+    """Enveloppe un module du pipeline pour mesurer son temps de traitement."""
+
+    def __init__(self, module):
+        self.module = module
+        self.handles = getattr(module, "handles", ("*",))
+        self.name = type(module).__name__
+        self.calls = 0
+        self.elapsed = 0.0
+
+    def handle_packet(self, ctx):
+        t0 = time.perf_counter()
+        verdict = self.module.handle_packet(ctx)
+        self.elapsed += time.perf_counter() - t0
+        self.calls += 1
+        return verdict
+
+
+# --------------------- Construction des paquets ---------------------
+
+def _mac(ip):
+    return EthAddr(HOSTS[ip][0])
+
+
+def _arp_packet(opcode, hwsrc, src_ip, dst_ip, hwdst=None):
+    a = arp()
+    a.opcode = opcode
+    a.hwsrc = hwsrc
+    a.hwdst = hwdst or EthAddr("00:00:00:00:00:00")
+    a.protosrc = IPAddr(src_ip)
+    a.protodst = IPAddr(dst_ip)
+    e = ethernet(type=ethernet.ARP_TYPE, src=hwsrc,
+                 dst=hwdst or ETHER_BROADCAST)
+    e.payload = a
+    return e.pack()
+
+
+def _ip_packet(src_mac, dst_mac, src_ip, dst_ip, l4, protocol):
+    ip = ipv4()
+    ip.protocol = protocol
+    ip.srcip = IPAddr(src_ip)
+    ip.dstip = IPAddr(dst_ip)
+    ip.payload = l4
+    e = ethernet(type=ethernet.IP_TYPE, src=src_mac, dst=dst_mac)
+    e.payload = ip
+    return e.pack()
+
+
+def _tcp_packet(src_mac, dst_mac, src_ip, dst_ip, sport, dport, flags,
+                payload=b""):
+    t = tcp()
+    t.srcport = sport
+    t.dstport = dport
+    t.off = 5
+    t.win = 29200
+    t.flags = flags
+    t.payload = payload
+    return _ip_packet(src_mac, dst_mac, src_ip, dst_ip, t, ipv4.TCP_PROTOCOL)
+
+
+def _icmp_packet(src_mac, dst_mac, src_ip, dst_ip, seq):
+    i = icmp()
+    i.type = TYPE_ECHO_REQUEST
+    i.payload = echo(id=1, seq=seq)
+    return _ip_packet(src_mac, dst_mac, src_ip, dst_ip, i, ipv4.ICMP_PROTOCOL)
+
+
+def _normal_packet(rnd, i):
+    """Trafic client : ARP, connexions HTTP et pings vers le serveur."""
+    cli = rnd.choice(CLIENTS)
+    mac, port = _mac(cli), HOSTS[cli][1]
+    gw = _mac(GATEWAY)
+    kind = rnd.random()
+    if kind < 0.05:
+        return port, _arp_packet(arp.REQUEST, mac, cli, GATEWAY)
+    if kind < 0.10:
+        return HOSTS[GATEWAY][1], _arp_packet(arp.REPLY, gw, GATEWAY, cli, mac)
+    if kind < 0.20:
+        return port, _icmp_packet(mac, gw, cli, SERVER, i & 0xffff)
+    sport = rnd.randint(1024, 65535)
+    if kind < 0.40:
+        return port, _tcp_packet(mac, gw, cli, SERVER, sport, 80, tcp.SYN_flag)
+    if kind < 0.60:
+        return HOSTS[GATEWAY][1], _tcp_packet(gw, mac, SERVER, cli, 80, sport,
+                                              tcp.SYN_flag | tcp.ACK_flag)
+    return port, _tcp_packet(mac, gw, cli, SERVER, sport, 80,
+                             tcp.PSH_flag | tcp.ACK_flag,
+                             b"GET / HTTP/1.1\r\nHost: srv\r\n\r\n" + b"x" * 1200)
+
+
+def _attack_packet(mix, rnd, i):
+    att_mac, att_port = _mac(ATTACKER), HOSTS[ATTACKER][1]
+    if mix == "arp_spoof":
+        # L'attaquant se fait passer pour la passerelle auprès des clients
+        return att_port, _arp_packet(arp.REPLY, att_mac, GATEWAY,
+                                     rnd.choice(CLIENTS), _mac(rnd.choice(CLIENTS)))
+    sport = rnd.randint(1024, 65535)
+    if mix == "syn_flood":
+        return att_port, _tcp_packet(att_mac, _mac(GATEWAY), ATTACKER, SERVER,
+                                     sport, 80, tcp.SYN_flag)
+    # spoofed_ddos : une IP source forgée par paquet (ddos_spoofed_syn.py)
+    src_ip = "10.0.%d.%d" % (rnd.randint(1, 254), rnd.randint(1, 254))
+    return att_port, _tcp_packet(att_mac, _mac(GATEWAY), src_ip, SERVER,
+                                 sport, 80, tcp.SYN_flag)
+
+
+def synthetic_trace(mix, packets, seed=42, attack_ratio=0.8):
+    """Liste de (port, paquet brut) pour un mélange de trafic."""
+    rnd = random.Random(seed)
+    # Le trafic commence par les ARP des hosts (apprentissage des ports)
+    trace = [(HOSTS[ip][1], _arp_packet(arp.REQUEST, _mac(ip), ip, GATEWAY))
+             for ip in HOSTS if ip != GATEWAY]
+    trace.append((HOSTS[GATEWAY][1],
+                  _arp_packet(arp.REQUEST, _mac(GATEWAY), GATEWAY, CLIENTS[0])))
+    for i in range(packets - len(trace)):
+        if mix != "normal" and rnd.random() < attack_ratio:
+            trace.append(_attack_packet(mix, rnd, i))
+        else:
+            trace.append(_normal_packet(rnd, i))
+    return trace
+
+
+def pcap_trace(path, packets=None):
+    """
+    Liste de (port, paquet brut) lue dans un fichier pcap (format libpcap).
+    Le port d'entrée est attribué à la première MAC source vue.
+    """
+    trace = []
+    ports = {}
+    with open(path, "rb") as f:
+        header = f.read(24)
+        magic = struct.unpack("<I", header[:4])[0]
+        endian = "<" if magic in (0xa1b2c3d4, 0xa1b23c4d) else ">"
+        while packets is None or len(trace) < packets:
+            rec = f.read(16)
+            if len(rec) < 16:
+                break
+            _, _, incl_len, _ = struct.unpack(endian + "IIII", rec)
+            raw = f.read(incl_len)
+            src = raw[6:12]
+            port = ports.setdefault(src, len(ports) + 1)
+            trace.append((port, raw))
+    return trace
+
+
+# --------------------- Exécution ---------------------
+
+def run_trace(name, trace, buffered=True):
+    """Rejoue une trace dans un pipeline neuf et affiche les mesures."""
+    conn = FakeConnection(dpid=1)
+
+    # État global du module remis à zéro pour chaque mélange
+    dfw.ip_host_table.clear()
+    dfw.mitigations = MitigationRegistry(get_connections=lambda: [conn])
+
+    arp_fw = dfw.ARPFirewall(conn)
+    fw = dfw.AnalyticalFirewall(conn, mac_table=arp_fw.mac_table)
+    modules = [TimedModule(arp_fw), TimedModule(dfw.DOSFirewall(conn))]
+    for m in modules:
+        fw.add_module(m)
+
+    events = [FakePacketIn(conn, port, raw, buffer_id=i if buffered else None)
+              for i, (port, raw) in enumerate(trace)]
+
+    t0 = time.perf_counter()
+    for event in events:
+        fw._handle_PacketIn(event)
+    elapsed = time.perf_counter() - t0
+
+    n = len(events)
+    print("=== %s : %d PacketIn ===" % (name, n))
+    print("  débit       : %10.0f paquets/s (%.1f µs/paquet)"
+          % (n / elapsed, elapsed / n * 1e6))
+    modules_time = 0.0
+    for m in modules:
+        modules_time += m.elapsed
+        print("  %-12s: %10.1f µs/paquet (%d appels)"
+              % (m.name, m.elapsed / n * 1e6, m.calls))
+    print("  %-12s: %10.1f µs/paquet" % ("forwarding",
+                                          (elapsed - modules_time) / n * 1e6))
+    print("  messages    : %s (%d octets, %.2f msg/paquet)"
+          % (", ".join("%s=%d" % kv for kv in sorted(conn.sent.items())),
+             conn.bytes, sum(conn.sent.values()) / float(n)))
+    return n / elapsed
+
+
+@poxutil.eval_args
+def launch(mix="all", packets=20000, pcap=None, unbuffered=False, seed=42):
+    """
+    --mix        : normal, arp_spoof, syn_flood, spoofed_ddos ou all
+    --packets    : nombre de PacketIn par mélange
+    --pcap       : rejoue un fichier pcap au lieu du trafic synthétique
+    --unbuffered : simule un switch sans buffer (paquet complet dans le PacketIn)
+    """
+    def _run(event):
+        if pcap:
+            traces = [("pcap", pcap_trace(pcap, packets))]
+        else:
+            mixes = MIXES if mix == "all" else mix.split(",")
+            traces = [(m, synthetic_trace(m, packets, seed)) for m in mixes]
+        for name, trace in traces:
+            run_trace(name, trace, buffered=not unbuffered)
+        core.quit()
+
+    core.addListenerByName("UpEvent", _run)
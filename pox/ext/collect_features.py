@@ -1,129 +1,56 @@
 from pox.core import core
-import pox.openflow.libopenflow_01 as of
-from pox.lib.packet.ethernet import ethernet
-from pox.lib.packet.arp import arp
-from pox.lib.packet.ipv4 import ipv4
-from pox.lib.packet.tcp import tcp
-from pox.lib.packet.udp import udp
 
-from ml.utils import (
-    now, create_state, get_global_state,
-    compute_features, save_to_csv,
-    EMIT_INTERVAL, WINDOW_SECONDS, reset_state
-)
+from ml.utils import WINDOW_SECONDS
+from ml.sketch import HLL_ERROR
+from ml.sink import FeatureSink, SINK_FORMATS, FLUSH_SECONDS
+import feature_extractor
 
 log = core.getLogger()
-state = get_global_state()
-
-
-def _handle_PacketIn(event):
-    packet = event.parsed
-    if not packet:
-        return
-
-    t = now()
-    eth = packet
-    src_mac = eth.src
-
-    # ---------------------
-    # ARP packets
-    # ---------------------
-    if eth.type == ethernet.ARP_TYPE:
-        a = packet.find('arp')
-        if not a:
-            return
-
-        src_ip = a.protosrc.toStr()
-        s = state[src_ip]
-
-        if s["last_mac"] and s["last_mac"] != src_mac:
-            s["mac_changes"] += 1
-        s["last_mac"] = src_mac
-
-        if a.opcode == arp.REQUEST:
-            s["arp_req"] += 1
-        elif a.opcode == arp.REPLY:
-            s["arp_rep"] += 1
-
-        s["pkt_times"].append(t)
-        s["pkt_count"] += 1
-        s["byte_count"] += len(eth)
-        s["pkt_sizes"].append(len(eth))
-
-        while s["pkt_times"] and (t - s["pkt_times"][0] > WINDOW_SECONDS):
-            s["pkt_times"].popleft()
-
-        return
-
-    # ---------------------
-    # IPv4 packets
-    # ---------------------
-    ip_pkt = packet.find('ipv4')
-    if ip_pkt:
-        src_ip = ip_pkt.srcip.toStr()
-        dst_ip = ip_pkt.dstip.toStr()
-        s = state[src_ip]
-
-        if s["last_mac"] and s["last_mac"] != src_mac:
-            s["mac_changes"] += 1
-        s["last_mac"] = src_mac
-
-        s["pkt_times"].append(t)
-        s["pkt_count"] += 1
-        s["byte_count"] += len(eth)
-        s["pkt_sizes"].append(len(eth))
-        s["dst_ips"].add(dst_ip)
-
-        # TTL
-        try:
-            s["ttls"].append(ip_pkt.ttl)
-        except:
-            pass
-
-        # ---------------------
-        # TCP
-        # ---------------------
-        tcp_pkt = packet.find('tcp')
-        if tcp_pkt:
-            s["tcp_count"] += 1
-            s["dst_ports"].add(tcp_pkt.dstport)
-            s["flows"] += 1
-
-            # Flags
-            if tcp_pkt.SYN and not tcp_pkt.ACK:
-                s["syn_count"] += 1
-                s["incomplete_flows"] += 1
-            if tcp_pkt.ACK:
-                s["ack_count"] += 1
-            if tcp_pkt.FIN:
-                s["fin_count"] += 1
-            if tcp_pkt.RST:
-                s["rst_count"] += 1
-
-        # ---------------------
-        # UDP
-        # ---------------------
-        udp_pkt = packet.find('udp')
-        if udp_pkt:
-            s["udp_count"] += 1
-            s["dst_ports"].add(udp_pkt.dstport)
-            s["flows"] += 1
-
-        while s["pkt_times"] and (t - s["pkt_times"][0] > WINDOW_SECONDS):
-            s["pkt_times"].popleft()
-
-
-def _periodic_emit():
-    for src_ip, s in list(state.items()):
-        if s["pkt_count"] > 0:
-            feat = compute_features(src_ip, s)
-            save_to_csv(feat)
-        reset_state(s)
-
-    core.callDelayed(EMIT_INTERVAL, _periodic_emit)
-
-
-def launch():
-    core.openflow.addListenerByName("PacketIn", _handle_PacketIn)
-    core.callDelayed(EMIT_INTERVAL, _periodic_emit)
-    log.info("Module POX Collect lancé avec features avancées.")
+sinks = {}    # durée de fenêtre (s) -> FeatureSink, créés par launch()
+
+
+def _handle_WindowSnapshot(event):
+    sink = sinks.get(event.window)
+    if sink is not None and event.ips:
+        sink.write(event.ips, event.X, event.t)
+
+
+def _flush_sinks():
+    # Les lignes ne restent pas en mémoire quand les snapshots s'arrêtent
+    for sink in sinks.values():
+        sink.flush_due()
+    core.callDelayed(FLUSH_SECONDS, _flush_sinks)
+
+
+def _close_sinks(event):
+    # Écrit les lignes encore en mémoire à l'arrêt du contrôleur
+    for sink in sinks.values():
+        sink.close()
+
+
+def launch(distinct="exact", distinct_error=HLL_ERROR, formats=SINK_FORMATS,
+           windows=WINDOW_SECONDS):
+    """
+    Enregistre les features publiées par feature_extractor (lancé ici s'il
+    ne l'est pas déjà ; --distinct et --distinct_error sont alors ses
+    paramètres).
+    --distinct       : comptage des IP / ports de destination distincts,
+                       "exact" (sets) ou "hll" (HyperLogLog, mémoire fixe par source)
+    --distinct_error : erreur relative visée en mode hll
+    --formats        : fichiers de features écrits, "csv" et/ou "npz" (ex. "npz")
+    --windows        : fenêtres enregistrées, en secondes (ex. "1,5,30") ; une
+                       série de fichiers features-<durée>s-* par fenêtre
+    Le modèle doit être entraîné sur des features collectées avec le même
+    mode et la même fenêtre que forest_firewall.
+    """
+    extractor = feature_extractor.require(windows="", distinct=distinct,
+                                          distinct_error=distinct_error)
+    for seconds in feature_extractor.parse_windows(windows):
+        seconds = extractor.add_window(seconds)
+        sinks[seconds] = FeatureSink(name="features-%gs" % seconds, formats=formats, log=log)
+
+    extractor.addListenerByName("WindowSnapshot", _handle_WindowSnapshot)
+    core.addListenerByName("GoingDownEvent", _close_sinks)
+    core.callDelayed(FLUSH_SECONDS, _flush_sinks)
+    log.info("Module POX Collect lancé avec features avancées (fenêtres %s s, distinct=%s).",
+             windows, extractor.distinct)
@@ -5,45 +5,211 @@ from pox.lib.packet.arp import arp
 from pox.lib.packet.ipv4 import ipv4
 from pox.lib.addresses import EthAddr, IPAddr
 from pox.openflow.libopenflow_01 import ofp_packet_out, ofp_action_output, OFPP_FLOOD
+import pox.lib.util as poxutil
+from pox.lib.recoco import Timer
 
+from fw.context import PacketContext, TRAFFIC_CLASSES, traffic_ancestors
+from fw.mitigation import MitigationRegistry
+from fw.rate import SlidingWindowCounter
+from fw.table import StateTable, all_stats
+
+import sys
 import time
 
 log = core.getLogger()
 
+# Registre global des règles DROP (une seule installation par switch et par règle)
+mitigations = MitigationRegistry()
+
+# Paramètres du forwarding unicast (flows installés sur le switch)
+FLOW_IDLE_TIMEOUT = 10    # Secondes d'inactivité avant expiration du flow
+FLOW_HARD_TIMEOUT = 30    # Durée de vie maximale du flow en secondes
+FORWARD_COOKIE = 0xf1     # Cookie des flows de forwarding (statistiques DoS)
+
+# Octets du paquet envoyés au contrôleur par PacketIn quand le switch le garde
+# en buffer : Ethernet (14) + VLAN (4) + IPv4 max (60) + TCP max (60).
+# Un peu plus que le défaut OpenFlow 1.0 (OFP_DEFAULT_MISS_SEND_LEN = 128) :
+# les en-têtes restent complets même avec toutes les options IP / TCP
+MISS_SEND_LEN = 14 + 4 + 60 + 60
+
+# Granularité des flows de forwarding :
+#   - "exact"   : 10-tuple, chaque nouveau flux repasse par le contrôleur
+#   - "ip_pair" : un flow par couple IP→IP (compteurs lus par le mode DoS stats)
+FLOW_GRANULARITIES = ("exact", "ip_pair")
+
+class Verdict(object):
+    """
+    Décision renvoyée par handle_packet() de chaque module du pipeline.
+      - CONTINUE : pas d'avis, le module suivant est consulté
+      - FORWARD  : paquet légitime, transmis immédiatement par le pipeline
+      - DROP     : paquet rejeté, aucun packet_out n'est envoyé
+      - HANDLED  : le module a lui-même envoyé ce qu'il fallait au switch
+    """
+    CONTINUE = "continue"
+    FORWARD = "forward"
+    DROP = "drop"
+    HANDLED = "handled"
+
+
 class AnalyticalFirewall(object):
-    def __init__(self, connection):
+    """
+    Pipeline de modules de sécurité pour un switch.
+    Un PacketContext est construit une fois par PacketIn et passé à chaque
+    module (en-têtes et adresses analysés une seule fois).
+    Chaque module déclare les classes de trafic qu'il traite (attribut
+    `handles`) : un paquet ne visite que les modules concernés par sa classe.
+    Chaque module renvoie un Verdict ; le pipeline produit au plus un
+    packet_out par PacketIn, et aucun pour un paquet rejeté.
+    Les paquets acceptés sont transmis :
+      - en unicast avec installation d'un flow si le port de la MAC
+        destination est connu (mac_table)
+      - par flood sinon
+    """
+
+    def __init__(self, connection, mac_table=None, unicast=True,
+                 granularity="exact"):
+        """
+        mac_table   : table MAC -> port partagée (apprise par ARPFirewall)
+        unicast     : installe des flows unicast au lieu de flooder
+        granularity : granularité des flows installés (FLOW_GRANULARITIES)
+        """
         self.connection = connection
         connection.addListeners(self)
         self.modules = []
+        self.dispatch = {}       # classe de trafic -> modules à consulter
+        self._build_dispatch()
+
+        if mac_table is None:
+            mac_table = StateTable("mac_table", MAC_TABLE_SIZE, MAC_TABLE_TTL)
+        self.mac_table = mac_table
+        self.unicast = unicast
+        if granularity not in FLOW_GRANULARITIES:
+            raise ValueError("Granularité de flow inconnue : %s" % granularity)
+        self.granularity = granularity
 
     def add_module(self, module):
         self.modules.append(module)
+        self._build_dispatch()
+
+    def _build_dispatch(self):
+        """
+        Précalcule, pour chaque classe de trafic, la liste ordonnée des
+        modules qui la traitent. Sans attribut `handles`, un module reçoit tout.
+        """
+        self.dispatch = {}
+        for cls in TRAFFIC_CLASSES:
+            chain = traffic_ancestors(cls)
+            self.dispatch[cls] = [
+                m for m in self.modules
+                if chain.intersection(getattr(m, "handles", ("*",)))
+            ]
 
     def _handle_PacketIn(self, event):
-        packet = event.parsed
-        if not packet:
+        if not event.parsed:
             return
 
+        ctx = PacketContext(event)
+
         # *** PIPELINE DES FIREWALLS ***
-        for module in self.modules:
-            consumed = module.handle_packet(event)
-            if consumed:
-                return  # STOP : module a géré le paquet
+        for module in self.dispatch[ctx.traffic_class]:
+            verdict = module.handle_packet(ctx)
+            if verdict is None or verdict == Verdict.CONTINUE:
+                continue
+            if verdict == Verdict.FORWARD:
+                break
+            return  # STOP : paquet rejeté (DROP) ou déjà géré (HANDLED)
 
-        # sinon forwarding minimal
         # Normal learning-switch behavior
-        self.forward_packet(event)
+        self.forward_packet(ctx)
 
-    def forward_packet(self, event): 
-        # log.info("forwarding par analytical")
-        msg = of.ofp_packet_out(data=event.ofp)
-        msg.actions.append(of.ofp_action_output(port=of.OFPP_FLOOD))
+    def forward_packet(self, ctx):
+        """
+        Transmet le paquet :
+          - flood si la destination est inconnue (ou multicast)
+          - sinon installation d'un flow unicast pour que les paquets
+            suivants du même flux restent dans le datapath du switch
+        """
+        out_port = None
+        if self.unicast and not ctx.dst_mac.is_multicast:
+            # peek : le trafic vers un host ne prolonge pas son association
+            # MAC -> port, seule la MAC vue en source la rafraîchit
+            out_port = self.mac_table.peek(ctx.dst_mac)
+
+        if out_port is None:
+            self.flood_packet(ctx)
+            return
+
+        if out_port == ctx.in_port:
+            # La destination est derrière le port d'entrée : rien à faire
+            return
+
+        # Les paquets ARP restent visibles par le contrôleur (détection de spoofing)
+        if ctx.is_arp:
+            self.packet_out(ctx, out_port)
+            return
+
+        msg = of.ofp_flow_mod()
+        msg.match = self.flow_match(ctx)
+        msg.cookie = FORWARD_COOKIE
+        msg.idle_timeout = FLOW_IDLE_TIMEOUT
+        msg.hard_timeout = FLOW_HARD_TIMEOUT
+        msg.actions.append(of.ofp_action_output(port=out_port))
+        # Le switch transmet aussi le paquet courant : POX reprend le buffer_id
+        # du PacketIn, ou ajoute un packet_out avec ses données s'il n'est pas
+        # en buffer (flow_mod.data doit être l'ofp_packet_in, pas des octets)
+        msg.data = ctx.event.ofp
+        self.connection.send(msg)
+
+    def flow_match(self, ctx):
+        """
+        Match du flow de forwarding installé pour ce paquet.
+          - exact   : flow 10-tuple, chaque nouveau flux repasse par le pipeline
+          - ip_pair : flow par couple IP→IP, ses compteurs servent au DoS
+        """
+        if self.granularity == "ip_pair" and ctx.ipv4 is not None:
+            return of.ofp_match(in_port=ctx.in_port,
+                                dl_src=ctx.src_mac,
+                                dl_dst=ctx.dst_mac,
+                                dl_type=ethernet.IP_TYPE,
+                                nw_src=ctx.ipv4.srcip,
+                                nw_dst=ctx.ipv4.dstip)
+        return of.ofp_match.from_packet(ctx.packet, ctx.in_port)
+
+    def attach_packet(self, msg, ctx):
+        """
+        Désigne le paquet du PacketIn dans un packet_out :
+        par son buffer_id si le switch l'a gardé en buffer (seul l'identifiant
+        repart vers le switch), sinon en renvoyant ses données.
+        """
+        ofp = ctx.event.ofp
+        if ofp.buffer_id is not None and ofp.buffer_id != of.NO_BUFFER:
+            msg.buffer_id = ofp.buffer_id
+        else:
+            msg.data = ofp.data
+
+    def packet_out(self, ctx, port):
+        """Envoie le paquet du PacketIn sur `port`."""
+        msg = of.ofp_packet_out(in_port=ctx.in_port)
+        self.attach_packet(msg, ctx)
+        msg.actions.append(of.ofp_action_output(port=port))
         self.connection.send(msg)
 
+    def flood_packet(self, ctx):
+        """Diffuse le paquet sur tous les ports (destination inconnue)."""
+        self.packet_out(ctx, of.OFPP_FLOOD)
+
 
 # Paramètre : durée de blocage temporaire en cas de flood ou spoof ARP
 SPOOF_ARP_BLOCK_SECONDS = 3600
 
+# Tailles et durées de vie des tables d'état ARP (par switch)
+ARP_TABLE_SIZE = 4096
+ARP_TABLE_TTL = 1800      # Une IP inactive peut être réattribuée après ce délai
+ARP_REFUSED_LOG_EVERY = 1000  # Table ARP pleine : un warning toutes les N IP refusées
+MAC_TABLE_SIZE = 4096
+MAC_TABLE_TTL = 300       # Un host silencieux peut avoir changé de port
+BLOCKED_TABLE_SIZE = 1024
+
 class ARPFirewall(object):
     """
     Firewall ARP basique pour POX.
@@ -54,15 +220,26 @@ class ARPFirewall(object):
       - Gérer et filtrer les paquets ARP
     """
 
+    # Tout le trafic : l'apprentissage MAC → port et le filtrage des MAC
+    # bloquées concernent tous les paquets, l'analyse ARP seulement l'ARP
+    handles = ("*",)
+
     def __init__(self, connection):
         """
         Initialise les tables internes pour un switch donné.
         """
         self.connection = connection
 
-        self.arp_table = {}      # Associe une IP à (MAC, timestamp)
-        self.mac_table = {}      # Associe une MAC à un port (switch learning)
-        self.blocked = {}        # MAC -> infos de blocage (expiration, raison)
+        # Associe une IP à (MAC, timestamp). Pas d'éviction LRU : des ARP
+        # depuis des IP forgées ne doivent pas pousser dehors une association
+        # apprise (passerelle...), sinon son spoofing passerait inaperçu
+        self.arp_table = StateTable("arp_table", ARP_TABLE_SIZE, ARP_TABLE_TTL,
+                                    evict=False)
+        # Associe une MAC à un port (switch learning)
+        self.mac_table = StateTable("mac_table", MAC_TABLE_SIZE, MAC_TABLE_TTL)
+        # MAC -> infos de blocage (expiration, raison)
+        self.blocked = StateTable("blocked", BLOCKED_TABLE_SIZE,
+                                  SPOOF_ARP_BLOCK_SECONDS)
 
         log.info("ARPFirewall initialisé pour %s", connection.dpid)
 
@@ -71,55 +248,51 @@ class ARPFirewall(object):
         return time.time()
 
     def _handle_PacketIn(self, event):
+        """Handler PacketIn autonome (hors pipeline)."""
+        if not event.parsed:
+            return Verdict.CONTINUE
+        return self.handle_packet(PacketContext(event))
+
+    def handle_packet(self, ctx):
         """
-        Traite tous les paquets reçus.
+        Traite tous les paquets reçus et renvoie un Verdict.
         Ne s’intéresse vraiment qu’aux paquets ARP.
         """
-        packet = event.parsed
-        in_port = event.port
-
-        if not packet:
-            return
+        # Paquets d'une MAC bloquée (avant que le flow DROP ne s'applique)
+        if self.is_blocked(ctx.src_mac):
+            return Verdict.DROP
 
         # Traitement des paquets ARP uniquement
-        if packet.type == ethernet.ARP_TYPE:
-            self.handle_arp(event, packet, in_port)
-            return
+        if ctx.is_arp:
+            return self.handle_arp(ctx)
 
         # Pour les autres paquets : apprentissage MAC → port
-        self.learn_mac_port(packet.src, in_port)
+        self.learn_mac_port(ctx.src_mac, ctx.in_port)
 
         # C'est la classe appellante qui gere le forwarding
-        # Flood minimal en absence de forwarding avancé
-        # msg = of.ofp_packet_out(data=event.ofp)
-        # msg.actions.append(of.ofp_action_output(port=of.OFPP_FLOOD))
-        # self.connection.send(msg)
-
-    def handle_packet(self, event):
-        """Wrapper simple pour le handler PacketIn."""
-        self._handle_PacketIn(event)
+        return Verdict.CONTINUE
 
-    def handle_arp(self, event, packet, in_port):
+    def handle_arp(self, ctx):
         """
         Analyse le paquet ARP et applique les protections :
           - Détection de conflits ARP
           - Blocage des MAC suspectes
           - Mise à jour de la table ARP
-          - Diffusion (flood) du paquet s'il est légitime
+          - Transmission (FORWARD) du paquet s'il est légitime
         """
-        a = packet.find('arp')
+        a = ctx.arp
         if not a:
-            return
+            return Verdict.CONTINUE
 
-        src_ip = IPAddr(a.protosrc)
-        src_mac = EthAddr(a.hwsrc)
-        dst_ip = IPAddr(a.protodst)
+        src_ip = ctx.src_ip
+        src_mac = a.hwsrc
+        dst_ip = ctx.dst_ip
         now = self.now()
 
         # Vérifie si la source est actuellement bloquée
         if self.is_blocked(src_mac):
             log.warning(f"Paquet ARP ignoré (MAC bloquée) : {src_mac}")
-            return
+            return Verdict.DROP
 
         # Détection d’un conflit ARP : même IP mais MAC différente
         entry = self.arp_table.get(src_ip)
@@ -131,26 +304,29 @@ class ARPFirewall(object):
 
                 self.block_mac_temporarily(src_mac, reason="conflit ARP")
                 log.info("Paquet ARP suspect supprimé")
-                return
+                return Verdict.DROP
 
-        # Mise à jour de la table ARP
-        self.arp_table[src_ip] = (src_mac, now)
+        # Mise à jour de la table ARP (une nouvelle IP est refusée si la table est pleine)
+        if not self.arp_table.set(src_ip, (src_mac, now)):
+            refused = self.arp_table.refused
+            if refused == 1 or refused % ARP_REFUSED_LOG_EVERY == 0:
+                log.warning("Table ARP pleine (%d entrées) : %s (%s) non apprise, "
+                            "%d IP refusées au total", len(self.arp_table),
+                            src_ip, src_mac, refused)
+        self.learn_mac_port(ctx.src_mac, ctx.in_port)
 
         # Détection d’un ARP gratuitous
         if src_ip == dst_ip:
             log.info("ARP gratuitous depuis %s (%s)", src_ip, src_mac)
 
-        # Flood du paquet ARP (comportement normal)
-        msg = of.ofp_packet_out(data=event.ofp)
-        msg.actions.append(of.ofp_action_output(port=OFPP_FLOOD))
-        self.connection.send(msg)
+        # Paquet ARP légitime : le pipeline le transmet (un seul packet_out)
+        return Verdict.FORWARD
 
     def learn_mac_port(self, mac, port):
         """
         Learning switch : associe une adresse MAC au port où elle a été vue.
         """
-        if mac not in self.mac_table or self.mac_table[mac] != port:
-            self.mac_table[mac] = port
+        self.mac_table[mac] = port
 
     def block_mac_temporarily(self, mac, seconds=SPOOF_ARP_BLOCK_SECONDS, reason="inconnu"):
         """
@@ -160,24 +336,19 @@ class ARPFirewall(object):
         if isinstance(mac, str):
             mac = EthAddr(mac)
 
-        log.warning("Blocage de %s pour %s secondes (raison : %s)",
-                    mac, seconds, reason)
+        if mac not in self.blocked:
+            log.warning("Blocage de %s pour %s secondes (raison : %s)",
+                        mac, seconds, reason)
 
         self.blocked[mac] = {
             'until': self.now() + seconds,
             'reason': reason
         }
 
-        # Installation du flow DROP
-        msg = of.ofp_flow_mod()
-        msg.priority = 65535
-        msg.actions = []  # Aucune action → DROP
-        msg.match.dl_src = mac
-        msg.idle_timeout = seconds
-        msg.hard_timeout = seconds
-        self.connection.send(msg)
-
-        log.info("Flow DROP installé pour %s", mac)
+        # Installation du flow DROP (une seule fois par switch)
+        if mitigations.block(("dl_src", mac), of.ofp_match(dl_src=mac), seconds,
+                             connections=[self.connection], reason=reason):
+            log.info("Flow DROP installé pour %s", mac)
 
     def is_blocked(self, mac):
         """
@@ -199,10 +370,20 @@ class ARPFirewall(object):
 # Paramètres de détection DoS
 DOS_WINDOW = 5.0          # Fenêtre d'observation en secondes
 DOS_THRESHOLD = 100       # Seuil de paquets par fenêtre
+DOS_BUCKETS = 10          # Nombre de buckets de la fenêtre glissante
 DOS_BLOCK_TIME = 3600     # Durée de blocage d’un host en secondes
+DOS_STATS_INTERVAL = 2.0  # Intervalle de relevé des statistiques de flows (mode stats)
+
+# Tailles et durées de vie des tables d'état DoS
+DOS_FLOW_TABLE_SIZE = 16384   # Couples IP→IP suivis par switch
+FLOW_OWNER_SIZE = 16384       # Initiateurs de flux mémorisés par switch
+FLOW_OWNER_TTL = 300
+IP_HOST_TABLE_SIZE = 8192     # Hosts localisés (tous switches confondus)
+IP_HOST_TABLE_TTL = 3600
 
 # Table globale : permet de retrouver sur quel switch/port/MAC se trouve une IP
-ip_host_table = {}        # IP -> (dpid, port, mac)
+# IP -> (dpid, port, mac)
+ip_host_table = StateTable("ip_host_table", IP_HOST_TABLE_SIZE, IP_HOST_TABLE_TTL)
 
 class DOSFirewall(object):
     """
@@ -212,23 +393,43 @@ class DOSFirewall(object):
       - Détection d'activité DoS (trop de paquets par fenêtre)
       - Identification de l’initiateur du flux
       - Blocage global d’un host sur tous les switches
+    En mode stats, les paquets qui passent par les flows de forwarding
+    (granularité "ip_pair") sont comptés par le switch : leurs compteurs
+    sont relevés périodiquement (ofp_flow_stats_request) et les deltas
+    alimentent la même fenêtre glissante que les PacketIn.
     """
 
-    def __init__(self, connection):
+    handles = ("ipv4",)
+
+    def __init__(self, connection, use_stats=False,
+                 stats_interval=DOS_STATS_INTERVAL):
         """
         Initialise l'état du firewall pour un switch donné.
+        use_stats      : compte aussi les paquets via les statistiques de flows
+        stats_interval : intervalle de relevé des statistiques (secondes)
         """
         self.connection = connection
 
-        # Historique des flux : associe un couple IP→IP à une liste de timestamps
-        self.flow_history = {}
+        # Historique des flux : compteurs par couple IP→IP sur une fenêtre glissante
+        self.flow_history = SlidingWindowCounter(
+            DOS_WINDOW, DOS_BUCKETS,
+            table=StateTable("flow_history", DOS_FLOW_TABLE_SIZE, DOS_WINDOW))
 
         # Mémorise qui a initié un flux (utile pour éviter de pénaliser la victime)
-        self.flow_owner = {}
+        # Une seule entrée par couple, clé ordonnée (petite IP, grande IP)
+        self.flow_owner = StateTable("flow_owner", FLOW_OWNER_SIZE, FLOW_OWNER_TTL)
 
-        self.last_reset = time.time()
+        # Mode stats : dernier (packet_count, duration_sec) connu par flow
+        # (in_port, dl_src, dl_dst, src_ip, dst_ip)
+        self.use_stats = use_stats
+        self.flow_counts = {}
+        if use_stats:
+            connection.addListenerByName("FlowStatsReceived",
+                                         self._handle_FlowStatsReceived)
+            Timer(stats_interval, self.request_flow_stats, recurring=True)
 
-        log.info("DOSFirewall initialisé pour switch %s", connection.dpid)
+        log.info("DOSFirewall initialisé pour switch %s%s", connection.dpid,
+                 " (statistiques de flows)" if use_stats else "")
 
     def now(self):
         """Renvoie le timestamp actuel."""
@@ -240,139 +441,210 @@ class DOSFirewall(object):
         Bloque un host sur tous les switches en installant un flow DROP
         basé sur son adresse MAC.
         """
-        if src_ip not in ip_host_table:
+        entry = ip_host_table.get(src_ip)
+        if entry is None:
             log.warning("Impossible de bloquer IP %s : inconnue", src_ip)
             return
 
-        dpid, port, mac = ip_host_table[src_ip]
+        dpid, port, mac = entry
 
-        log.warning("Blocage DoS : installation DROP pour IP %s (MAC %s)", src_ip, mac)
-
-        # Installation de la règle DROP sur tous les switches
-        for conn in core.openflow._connections.values():
-            msg = of.ofp_flow_mod()
-            msg.priority = 65535
-            msg.match.dl_src = mac
-            msg.actions = []                 # Aucune action → DROP
-            msg.idle_timeout = DOS_BLOCK_TIME
-            msg.hard_timeout = DOS_BLOCK_TIME
-            conn.send(msg)
-
-        log.warning(">>> HOST %s BLOQUÉ AVEC SUCCÈS <<<", src_ip)
+        # Installation de la règle DROP sur tous les switches ; le registre
+        # n'envoie rien si elle est déjà installée ou en cours d'installation
+        sent = mitigations.block(("dl_src", mac), of.ofp_match(dl_src=mac),
+                                 DOS_BLOCK_TIME, reason="DoS depuis %s" % src_ip)
+        if sent:
+            log.warning(">>> HOST %s (MAC %s) BLOQUÉ AVEC SUCCÈS <<<", src_ip, mac)
 
     def get_flow_owner(self, src_ip, dst_ip):
         """
         Identifie l’initiateur réel d’un flux IP↔IP.
         Le premier qui émet un paquet est considéré comme propriétaire.
         """
-        a = (src_ip, dst_ip)
-        b = (dst_ip, src_ip)
+        key = (src_ip, dst_ip) if src_ip < dst_ip else (dst_ip, src_ip)
+        owner = self.flow_owner.get(key)
 
         # Premier paquet pour ce couple → src_ip devient l’initiateur
-        if a not in self.flow_owner and b not in self.flow_owner:
-            self.flow_owner[a] = src_ip
-            self.flow_owner[b] = src_ip
+        if owner is None:
+            self.flow_owner[key] = src_ip
             return src_ip
 
         # Retourne l’initiateur enregistré
-        return self.flow_owner.get(a, self.flow_owner.get(b))
+        return owner
 
-    def detect_dos(self, src_ip, dst_ip):
+    def detect_dos(self, src_ip, dst_ip, n=1, t=None):
         """
-        Compte le nombre de paquets pour un couple IP→IP
+        Compte `n` paquets pour un couple IP→IP
         dans une fenêtre glissante et déclenche une alerte
         s'il dépasse le seuil configuré.
         """
-        t = self.now()
-
-        # Réinitialisation périodique de l'historique
-        if t - self.last_reset > DOS_WINDOW:
-            self.flow_history.clear()
-            self.last_reset = t
-
-        key = (src_ip, dst_ip)
-        history = self.flow_history.setdefault(key, [])
-        history.append(t)
-
-        # Suppression des timestamps trop anciens
-        while history and history[0] < t - DOS_WINDOW:
-            history.pop(0)
+        if t is None:
+            t = self.now()
+        count = self.flow_history.hit((src_ip, dst_ip), t, n)
 
         # Détection d’un volume anormal
-        if len(history) > DOS_THRESHOLD:
-            log.warning("DoS détecté : %s → %s (%d pkts/s)",
-                        src_ip, dst_ip, len(history))
+        if count > DOS_THRESHOLD:
+            log.warning("DoS détecté : %s → %s (%d pkts / %ss)",
+                        src_ip, dst_ip, count, DOS_WINDOW)
             return True
 
         return False
 
-    def handle_packet(self, event):
-        """Handler principal appelé par POX."""
-        self._handle_PacketIn(event)
-
     def _handle_PacketIn(self, event):
+        """Handler PacketIn autonome (hors pipeline)."""
+        if not event.parsed:
+            return Verdict.CONTINUE
+        return self.handle_packet(PacketContext(event))
+
+    def request_flow_stats(self):
+        """
+        Demande au switch les compteurs des flows IPv4.
+        Renvoie False (arrêt du Timer) si le switch est déconnecté.
+        """
+        if self.connection.disconnected:
+            return False
+        body = of.ofp_flow_stats_request(match=of.ofp_match(dl_type=ethernet.IP_TYPE))
+        self.connection.send(of.ofp_stats_request(body=body))
+
+    def _handle_FlowStatsReceived(self, event):
+        """
+        Convertit les compteurs des flows de forwarding en deltas par couple
+        IP→IP et applique la détection DoS (seuil DOS_THRESHOLD) sur ces deltas.
+        Un couple peut avoir plusieurs flows (autre port d'entrée, MAC
+        changée...) : le delta est calculé flow par flow puis additionné,
+        l'expiration de l'un ne recompte pas les paquets des autres.
+        """
+        counts = {}
+        deltas = {}
+        previous = self.flow_counts
+        for fs in event.stats:
+            if fs.cookie != FORWARD_COOKIE:
+                continue
+            m = fs.match
+            if m.nw_src is None or m.nw_dst is None:
+                continue
+            pair = (sys.intern(m.nw_src.toStr()), sys.intern(m.nw_dst.toStr()))
+            flow = (m.in_port, m.dl_src, m.dl_dst) + pair
+            counts[flow] = (fs.packet_count, fs.duration_sec)
+
+            last = previous.get(flow)
+            if last is None or fs.packet_count < last[0] or fs.duration_sec < last[1]:
+                # Nouveau flow, ou flow expiré puis réinstallé depuis le relevé
+                delta = fs.packet_count
+            else:
+                delta = fs.packet_count - last[0]
+            if delta > 0:
+                deltas[pair] = deltas.get(pair, 0) + delta
+
+        self.flow_counts = counts   # les flows expirés disparaissent
+        t = self.now()
+        for (src_ip, dst_ip), delta in deltas.items():
+            if self.get_flow_owner(src_ip, dst_ip) != src_ip:
+                continue
+            if self.detect_dos(src_ip, dst_ip, delta, t):
+                self.block_host_by_ip(src_ip)
+
+    def handle_packet(self, ctx):
         """
         Analyse minimale des paquets :
           - Extraction IP
           - Apprentissage de la position du host
           - Détection DoS si l’émetteur est l’initiateur du flux
-          - Flood basique des paquets
+        Renvoie DROP pour un paquet d'un host en DoS, CONTINUE sinon.
         """
-        packet = event.parsed
-        if not packet:
-            return
-
-        in_port = event.port
-        src_mac = packet.src
-
         # Extraction IPv4 uniquement
-        ip_packet = packet.find('ipv4')
-        if not ip_packet:
-            return
+        if ctx.ipv4 is None:
+            return Verdict.CONTINUE
 
-        src_ip = str(ip_packet.srcip)
-        dst_ip = str(ip_packet.dstip)
+        src_ip = ctx.src_ip
+        dst_ip = ctx.dst_ip
 
         # Enregistre où se trouve le host (switch, port, MAC)
-        if src_ip not in ip_host_table:
-            ip_host_table[src_ip] = (event.connection.dpid, in_port, src_mac)
+        if ip_host_table.get(src_ip) is None:
+            ip_host_table[src_ip] = (ctx.dpid, ctx.in_port, ctx.src_mac)
             log.info("Host appris : IP %s → switch %s port %s",
-                     src_ip, event.connection.dpid, in_port)
+                     src_ip, ctx.dpid, ctx.in_port)
 
         # Détection DoS seulement pour l’initiateur du flux
         owner = self.get_flow_owner(src_ip, dst_ip)
         if owner == src_ip:
             if self.detect_dos(src_ip, dst_ip):
                 self.block_host_by_ip(src_ip)
-                return
+                return Verdict.DROP
 
         # C'est la classe appellante qui gere le forwarding
-        # Flood minimal en absence de forwarding avancé
-        # msg = of.ofp_packet_out(data=event.ofp)
-        # msg.actions.append(of.ofp_action_output(port=of.OFPP_FLOOD))
-        # self.connection.send(msg)
+        return Verdict.CONTINUE
    
 
-def launch(**kwargs):
+# Intervalle d'affichage des statistiques des tables d'état (secondes)
+TABLE_STATS_INTERVAL = 60
+
+def _log_table_stats():
+    """Affiche la taille et les évictions des tables d'état."""
+    for st in all_stats():
+        log.debug("Table %(name)s : %(size)d/%(capacity)d entrées, "
+                  "évictions LRU=%(evicted_lru)d TTL=%(evicted_ttl)d, refus=%(refused)d", st)
+
+
+def configure_switch(connection, miss_send_len=MISS_SEND_LEN):
+    """
+    Taille des PacketIn d'un paquet en buffer : assez pour des en-têtes
+    complets (le défaut de 128 octets peut couper les options TCP).
+    """
+    connection.send(of.ofp_set_config(miss_send_len=miss_send_len))
+
+
+def launch(flood=False, dos_stats=None, stats_interval=DOS_STATS_INTERVAL,
+           miss_send_len=MISS_SEND_LEN, **kwargs):
     """
     Initialise le firewall global.
     À chaque nouveau switch connecté, un AnalyticalFirewall est créé
     et on lui ajoute les modules ARP et DoS.
+
+    --flood          : désactive l'installation de flows unicast (tout passe par le contrôleur)
+    --dos_stats      : comptage DoS dans le switch (flows par couple IP + statistiques) ;
+                       activé par défaut en unicast, sinon un flux déjà installé
+                       (flood ICMP/UDP, connexion TCP persistante) n'est plus vu
+    --stats_interval : intervalle de relevé des statistiques en secondes
+    --miss_send_len  : octets envoyés par PacketIn pour un paquet en buffer
+                       (défaut : en-têtes Ethernet/VLAN/IPv4/TCP complets)
     """
+    unicast = not poxutil.str_to_bool(flood)
+    if dos_stats is None:
+        dos_stats = unicast
+    else:
+        dos_stats = poxutil.str_to_bool(dos_stats)
+        if unicast and not dos_stats:
+            log.warning("DoS sans statistiques de flows : seuls les nouveaux flux sont "
+                        "comptés, un flood dans un flow déjà installé n'est pas détecté")
+    stats_interval = float(stats_interval)
+    miss_send_len = int(miss_send_len)
+    granularity = "ip_pair" if dos_stats else "exact"
 
     def start_switch(event):
         """
         Appelé lorsqu'un nouveau switch se connecte.
         Initialise le firewall du switch et y ajoute les modules actifs.
         """
-        fw = AnalyticalFirewall(event.connection)
+        configure_switch(event.connection, miss_send_len)
+
+        arp_fw = ARPFirewall(event.connection)
+        fw = AnalyticalFirewall(event.connection,
+                                mac_table=arp_fw.mac_table,
+                                unicast=unicast,
+                                granularity=granularity)
 
         # Ajout des modules de sécurité
-        fw.add_module(ARPFirewall(event.connection))   # Protection ARP
-        fw.add_module(DOSFirewall(event.connection))   # Détection/Blocage DoS
+        fw.add_module(arp_fw)                          # Protection ARP
+        fw.add_module(DOSFirewall(event.connection,    # Détection/Blocage DoS
+                                  use_stats=dos_stats,
+                                  stats_interval=stats_interval))
 
         log.info("AnalyticalFirewall prêt pour switch %s", event.connection.dpid)
 
     # Appelle start_switch à chaque nouvelle connexion OpenFlow
     core.openflow.addListenerByName("ConnectionUp", start_switch)
-    log.info("AnalyticalFirewall global activé avec modules ARP et DoS")
+    mitigations.start()
+    Timer(TABLE_STATS_INTERVAL, _log_table_stats, recurring=True)
+    log.info("AnalyticalFirewall global activé avec modules ARP et DoS (%s%s)",
+             "unicast" if unicast else "flood",
+             ", DoS par statistiques" if dos_stats else "")
@@ -0,0 +1,148 @@
+from pox.core import core
+from pox.lib.revent import Event, EventMixin
+from pox.lib.packet.ethernet import ethernet
+
+from ml.utils import now, BUCKET_SECONDS, WINDOWS
+from ml.state import StateStore
+from ml.sketch import HLL_ERROR
+from ml.window import WindowRing
+
+log = core.getLogger()
+
+
+class WindowSnapshot(Event):
+    """
+    Features de toutes les sources actives à la fin d'une fenêtre. Chaque
+    durée de fenêtre a ses propres événements : un abonné ne garde que
+    ceux de la sienne (event.window).
+    X est réutilisée par la fenêtre suivante : un abonné qui la garde
+    (ou l'envoie à un autre thread / processus) doit la copier.
+    """
+
+    def __init__(self, ips, X, t, window):
+        Event.__init__(self)
+        self.ips = ips        # IP source de chaque ligne
+        self.X = X            # (len(ips), len(FEATURE_COLUMNS))
+        self.t = t            # fin de la fenêtre
+        self.window = window  # durée de la fenêtre (secondes)
+
+
+class FeatureExtractor(EventMixin):
+    """
+    Seul composant qui analyse les PacketIn pour les features : l'état par
+    source (StateStore) est mis à jour une fois par paquet, quel que soit
+    le nombre d'abonnés. Toutes les `bucket` secondes, le bucket en cours
+    est fermé (WindowRing) ; chaque fenêtre qui se termine (1 s, 5 s,
+    30 s...) est publiée dans un WindowSnapshot.
+    Abonnement : core.FeatureExtractor.addListenerByName("WindowSnapshot", f),
+    après add_window(durée) pour une fenêtre qui n'est pas encore calculée.
+    """
+    _eventMixin_events = set([WindowSnapshot])
+
+    def __init__(self, windows=(), bucket=BUCKET_SECONDS, distinct="exact",
+                 distinct_error=HLL_ERROR):
+        self.bucket = bucket
+        self.distinct = distinct
+        self.store = StateStore(distinct=distinct, distinct_error=distinct_error)
+        self.ring = WindowRing(self.store, bucket)
+        for seconds in windows:
+            self.ring.add_window(seconds)
+        core.openflow.addListenerByName("PacketIn", self._handle_PacketIn)
+        core.callDelayed(bucket, self._emit)
+
+    @property
+    def windows(self):
+        return sorted(self.ring.windows)
+
+    def add_window(self, seconds):
+        """Calcule aussi la fenêtre de `seconds` secondes ; renvoie sa durée."""
+        return self.ring.add_window(float(seconds))
+
+    def _handle_PacketIn(self, event):
+        packet = event.parsed
+        if not packet:
+            return
+
+        store = self.store
+        t = now()
+        eth = packet
+        src_mac = eth.src
+
+        # --------------------- ARP ---------------------
+        if eth.type == ethernet.ARP_TYPE:
+            a = packet.find('arp')
+            if not a:
+                return
+
+            slot = store.record_packet(a.protosrc.toStr(), src_mac, t, len(eth))
+            if slot is not None:
+                store.record_arp(slot, a.opcode)
+            return
+
+        # --------------------- IPv4 ---------------------
+        ip_pkt = packet.find('ipv4')
+        if ip_pkt:
+            slot = store.record_packet(ip_pkt.srcip.toStr(), src_mac, t, len(eth))
+            if slot is None:
+                return
+            store.record_ipv4(slot, ip_pkt.dstip.toStr(), ip_pkt.ttl)
+
+            tcp_pkt = packet.find('tcp')
+            if tcp_pkt:
+                store.record_tcp(slot, tcp_pkt.dstport, tcp_pkt.SYN, tcp_pkt.ACK,
+                                 tcp_pkt.FIN, tcp_pkt.RST)
+
+            udp_pkt = packet.find('udp')
+            if udp_pkt:
+                store.record_udp(slot, udp_pkt.dstport)
+
+    def _emit(self):
+        t = now()
+        for seconds in self.ring.close_bucket():
+            ips, X = self.ring.features(seconds)
+            # Une erreur d'un abonné (journalisée) n'arrête pas les fenêtres
+            self.raiseEventNoErrors(WindowSnapshot, ips, X, t, seconds)
+
+        core.callDelayed(self.bucket, self._emit)
+
+
+def parse_windows(text):
+    """ "1,5,30" -> [1.0, 5.0, 30.0] """
+    return [float(w) for w in str(text).split(",") if w.strip()]
+
+
+def require(**kw):
+    """
+    Extracteur partagé : lancé avec les paramètres `kw` s'il ne l'est pas
+    encore (collect_features, forest_firewall), sinon celui qui existe.
+    """
+    if not core.hasComponent("FeatureExtractor"):
+        launch(**kw)
+    return core.FeatureExtractor
+
+
+def launch(windows=WINDOWS, bucket=BUCKET_SECONDS, distinct="exact",
+           distinct_error=HLL_ERROR):
+    """
+    --windows        : durées des fenêtres calculées, en secondes, séparées
+                       par des virgules (multiples de --bucket)
+    --bucket         : durée d'un bucket (secondes)
+    --distinct       : comptage des IP / ports de destination distincts,
+                       "exact" (sets) ou "hll" (HyperLogLog, mémoire fixe par source)
+    --distinct_error : erreur relative visée en mode hll
+    Le modèle doit être entraîné sur des features collectées avec les mêmes
+    paramètres et la même fenêtre.
+    """
+    if core.hasComponent("FeatureExtractor"):
+        # Déjà lancé par un abonné placé avant sur la ligne de commande
+        extractor = core.FeatureExtractor
+        for seconds in parse_windows(windows):
+            extractor.add_window(seconds)
+        log.warning("FeatureExtractor déjà lancé (bucket=%ss, distinct=%s) : "
+                    "seules les fenêtres %s sont ajoutées",
+                    extractor.bucket, extractor.distinct, windows)
+        return
+    core.registerNew(FeatureExtractor, parse_windows(windows), float(bucket),
+                     distinct, float(distinct_error))
+    log.info("Extraction des features lancée (fenêtres %s s, bucket %ss, distinct=%s).",
+             windows, bucket, distinct)
@@ -5,69 +5,40 @@ from pox.lib.packet.arp import arp
 from pox.lib.packet.ipv4 import ipv4
 from pox.lib.packet.tcp import tcp
 from pox.lib.packet.udp import udp
-import pandas as pd
 
-
-from ml.utils import (
-    now, create_state, get_global_state,
-    compute_features, reset_state
-)
-
-import joblib
-from sklearn.preprocessing import StandardScaler
+from ml.utils import WINDOW_SECONDS
+from ml.sketch import HLL_ERROR
+from ml.worker import ScoringWorker
+from ml.gate import Gate, parse_rules, GATE_RULES, AUDIT_RATE
+import feature_extractor
 
 log = core.getLogger()
-state = get_global_state()
+scorer = None  # ScoringWorker (modèle chargé dans le processus worker)
+gate = None    # Gate : règles simples avant le modèle
+score_window = None  # durée (s) de la fenêtre évaluée
 
-# Charger modèle + scaler
-DIR_TMP = "/tmp/pox/"
-DIR_MODELS = DIR_TMP + "models/"
-model = joblib.load(DIR_MODELS + "iforest_model.pkl")
-scaler = joblib.load(DIR_MODELS + "scaler.pkl")
+STATS_WINDOWS = 12   # bilan gate / worker toutes les N fenêtres évaluées
+TIMEOUT_WINDOWS = 3  # évaluation abandonnée (worker relancé) après N fenêtres
+_windows = 0
 
-EMIT_INTERVAL = 5  # Exemple : toutes les 5
+# IPs de l'évaluation en cours retenues seulement par l'audit
+_audited = set()
 
 malicious_ips = set()      # IPs détectées comme malveillantes
 blocked_pairs = set()      # paires (src_ip, dst_ip) à bloquer
 
 
 def _handle_PacketIn(event):
+    """
+    Drop du trafic entre IPs malveillantes. Appelé avant feature_extractor
+    (priorité plus haute) : un paquet bloqué n'est pas compté.
+    """
+    if not malicious_ips:
+        return
     packet = event.parsed
     if not packet:
         return
 
-    t = now()
-    eth = packet
-    src_mac = eth.src
-
-    # --------------------- ARP ---------------------
-    if eth.type == ethernet.ARP_TYPE:
-        a = packet.find('arp')
-        if not a:
-            return
-
-        src_ip = a.protosrc.toStr()
-        s = state[src_ip]
-
-        if s["last_mac"] and s["last_mac"] != src_mac:
-            s["mac_changes"] += 1
-        s["last_mac"] = src_mac
-
-        if a.opcode == arp.REQUEST:
-            s["arp_req"] += 1
-        elif a.opcode == arp.REPLY:
-            s["arp_rep"] += 1
-
-        s["pkt_times"].append(t)
-        s["pkt_count"] += 1
-        s["byte_count"] += len(eth)
-        s["pkt_sizes"].append(len(eth))
-
-        while s["pkt_times"] and (t - s["pkt_times"][0] > EMIT_INTERVAL):
-            s["pkt_times"].popleft()
-        return
-
-    # --------------------- IPv4 ---------------------
     ip_pkt = packet.find('ipv4')
     if ip_pkt:
         src_ip = ip_pkt.srcip.toStr()
@@ -78,94 +49,125 @@ def _handle_PacketIn(event):
             log.warning(f"Drop paquet entre {src_ip} <-> {dst_ip}")
             event.halt = True  # empêche l'envoi du paquet
             blocked_pairs.add((src_ip, dst_ip))
-            return
-
-        s = state[src_ip]
-
-        if s["last_mac"] and s["last_mac"] != src_mac:
-            s["mac_changes"] += 1
-        s["last_mac"] = src_mac
-
-        s["pkt_times"].append(t)
-        s["pkt_count"] += 1
-        s["byte_count"] += len(eth)
-        s["pkt_sizes"].append(len(eth))
-        s["dst_ips"].add(dst_ip)
-
-        try:
-            s["ttls"].append(ip_pkt.ttl)
-        except:
-            pass
-
-        tcp_pkt = packet.find('tcp')
-        if tcp_pkt:
-            s["tcp_count"] += 1
-            s["dst_ports"].add(tcp_pkt.dstport)
-            s["flows"] += 1
-
-            if tcp_pkt.SYN and not tcp_pkt.ACK:
-                s["syn_count"] += 1
-                s["incomplete_flows"] += 1
-            if tcp_pkt.ACK:
-                s["ack_count"] += 1
-            if tcp_pkt.FIN:
-                s["fin_count"] += 1
-            if tcp_pkt.RST:
-                s["rst_count"] += 1
-
-        udp_pkt = packet.find('udp')
-        if udp_pkt:
-            s["udp_count"] += 1
-            s["dst_ports"].add(udp_pkt.dstport)
-            s["flows"] += 1
-
-        while s["pkt_times"] and (t - s["pkt_times"][0] > EMIT_INTERVAL):
-            s["pkt_times"].popleft()
-
-
-def _periodic_firewall():
-    if len(state.items()) == 0 :
+
+
+def _log_stats():
+    """Compteurs cumulés du gate (par niveau et par règle) et du worker."""
+    st = gate.stats()
+    log.info("Gate : %(seen)d sources vues, %(flagged)d suspectes, %(audited)d en audit, "
+             "%(passed)d non évaluées, %(audit_hits)d anomalies trouvées par l'audit", st)
+    log.info("Gate, règles déclenchées : %s",
+             ", ".join("%s=%d" % kv for kv in sorted(st["hits"].items())) or "aucune règle")
+    log.info("Worker : %(submitted)d évaluations, %(completed)d terminées, %(skipped)d ignorées, "
+             "%(failed)d échecs, délai moyen %(delay_avg).3f s (max %(delay_max).3f s)",
+             scorer.stats())
+
+
+def _handle_WindowSnapshot(event):
+    global _audited, _windows
+    if event.window != score_window:
+        return
+    _windows += 1
+    if _windows % STATS_WINDOWS == 0:
+        _log_stats()
+    ips, X = event.ips, event.X
+    if not ips:
         log.info("Pas de donnée")
-        return 
-    for src_ip, s in list(state.items()):
-        if s["pkt_count"] == 0:
-            continue  # rien à analyser
-
-        feat = compute_features(src_ip, s)
-        try:
-            feat_df = pd.DataFrame([feat])
-            numeric_cols = [c for c in feat_df.columns if c not in ["timestamp", "src_ip"]]
-            X_scaled = scaler.transform(feat_df[numeric_cols])
-            pred = model.predict(X_scaled)[0]
-        except Exception as e:
-            log.error(f"Erreur ML pour {src_ip}: {e}")
-            pred = 1  # on considère normal par défaut
-
-        if pred == -1:
-            log.warning(f"Anomalie détectée sur {src_ip} - blocage du trafic")
-            malicious_ips.add(src_ip) 
-            _block_ip(src_ip)
-        else: 
-            log.info("Aucun probleme detecter")
-
-        reset_state(s)
-
-    core.callDelayed(EMIT_INTERVAL, _periodic_firewall)
-
-
-def _block_ip(ip):
-    # pass
+        return
+    # Seules les sources suspectes (et l'échantillon d'audit) vont au modèle
+    rows, audit = gate.select(X)
+    log.debug("%d sources : %d suspectes, %d en audit, %d non évaluées",
+              len(ips), len(rows) - int(audit.sum()), int(audit.sum()),
+              len(ips) - len(rows))
+    selected = [ips[i] for i in rows]
+    if selected:
+        if scorer.submit(selected, X[rows]):
+            _audited = set(ip for ip, a in zip(selected, audit) if a)
+        else:
+            log.warning("Évaluation précédente en cours : fenêtre de %d IPs ignorée",
+                        len(selected))
+
+
+def _on_reload(version, error):
+    if error is not None:
+        log.error(f"Rechargement du modèle impossible, ancien modèle conservé : {error}")
+    else:
+        log.info("Modèle chargé par le worker (%d rechargement(s))", scorer.reloads)
+
+
+def _on_error(ips, e):
+    log.error(f"Erreur ML sur {len(ips)} IPs : {e}")
+    # on considère normal par défaut
+
+
+def _on_verdict(ips, preds, delay):
+    """
+    Verdict du worker pour toutes les IPs d'un snapshot (exécuté dans la
+    boucle POX) : blocage des nouvelles anomalies.
+    """
+    log.debug("Verdict de %d IPs reçu %.0f ms après le snapshot (max %.0f ms)",
+              len(ips), delay * 1000, scorer.delay_max * 1000)
+
+    anomalies = [ip for ip, pred in zip(ips, preds) if pred == -1]
+    if not anomalies:
+        log.info("Aucun probleme detecter (%d IPs analysées)", len(ips))
+        return
+
+    for ip in anomalies:
+        if ip in _audited:
+            # Le modèle trouve une anomalie que les règles n'ont pas vue
+            gate.audit_hits += 1
+            log.warning(f"Anomalie détectée sur {ip} par l'audit (hors règles) - blocage du trafic")
+        else:
+            log.warning(f"Anomalie détectée sur {ip} - blocage du trafic")
+
+    # Les IPs déjà bloquées ne renvoient pas de flow
+    new_ips = [ip for ip in anomalies if ip not in malicious_ips]
+    malicious_ips.update(new_ips)
+    _block_ips(new_ips)
+
+
+def _block_ips(ips):
+    """Installe un flow DROP par IP sur chaque switch."""
+    if not ips:
+        return
     for conn in core.openflow._connections.values():
-        fm = of.ofp_flow_mod()
-        fm.match.dl_type = 0x800  # IPv4
-        fm.match.nw_src = ip
-        fm.actions = []  # pas d'action = drop
-        fm.priority = 100
-        conn.send(fm)
-        log.info(f"Flow ajouté pour bloquer {ip}")
-
-
-def launch():
-    core.openflow.addListenerByName("PacketIn", _handle_PacketIn)
-    core.callDelayed(EMIT_INTERVAL, _periodic_firewall)
-    log.info("Module POX Firewall ML lancé.")
+        for ip in ips:
+            fm = of.ofp_flow_mod()
+            fm.match.dl_type = 0x800  # IPv4
+            fm.match.nw_src = ip
+            fm.actions = []  # pas d'action = drop
+            fm.priority = 100
+            conn.send(fm)
+    log.info("Flows ajoutés pour bloquer %s", ", ".join(ips))
+
+
+def launch(distinct="exact", distinct_error=HLL_ERROR, gate_rules=GATE_RULES,
+           audit=AUDIT_RATE, window=WINDOW_SECONDS):
+    """
+    Évalue les features publiées par feature_extractor (lancé ici s'il ne
+    l'est pas déjà ; --distinct et --distinct_error sont alors ses
+    paramètres).
+    --distinct       : comptage des IP / ports de destination distincts,
+                       "exact" (sets) ou "hll" (HyperLogLog, mémoire fixe par source)
+    --distinct_error : erreur relative visée en mode hll
+    --gate_rules     : règles feature=seuil avant le modèle, séparées par des
+                       virgules (vide : toutes les sources sont évaluées)
+    --audit          : part des sources non suspectes évaluées quand même
+    --window         : fenêtre évaluée (secondes), celle des features
+                       d'entraînement du modèle
+    Le modèle doit être entraîné sur des features collectées avec le même mode.
+    """
+    global scorer, gate, score_window
+    gate = Gate(parse_rules(gate_rules), float(audit))
+    scorer = ScoringWorker(_on_verdict, _on_error, core.callLater, _on_reload,
+                           timeout=TIMEOUT_WINDOWS * float(window))
+    core.addListenerByName("GoingDownEvent", lambda event: scorer.shutdown())
+
+    extractor = feature_extractor.require(windows="", distinct=distinct,
+                                          distinct_error=distinct_error)
+    score_window = extractor.add_window(window)
+    extractor.addListenerByName("WindowSnapshot", _handle_WindowSnapshot)
+    core.openflow.addListenerByName("PacketIn", _handle_PacketIn, priority=1)
+    log.info("Module POX Firewall ML lancé (fenêtre %ss, distinct=%s).",
+             score_window, extractor.distinct)
@@ -0,0 +1 @@
+# Briques communes aux modules du firewall (default_firewall)
@@ -0,0 +1,116 @@
+import sys
+from functools import cached_property
+
+from pox.lib.packet.ethernet import ethernet
+
+# Classes de trafic et leur parent : un module qui déclare une classe
+# reçoit aussi toutes ses sous-classes ("*" = tout le trafic)
+TRAFFIC_PARENTS = {
+    "arp": "*",
+    "ipv4": "*",
+    "other": "*",
+    "tcp": "ipv4",
+    "udp": "ipv4",
+    "icmp": "ipv4",
+    "tcp_syn": "tcp",     # SYN sans ACK (ouverture de connexion)
+}
+TRAFFIC_CLASSES = list(TRAFFIC_PARENTS)
+
+
+def traffic_ancestors(cls):
+    """Classe `cls` et toutes ses classes parentes, jusqu'à "*"."""
+    chain = {cls}
+    while cls != "*":
+        cls = TRAFFIC_PARENTS[cls]
+        chain.add(cls)
+    return chain
+
+
+class PacketContext(object):
+    """
+    Contexte d'un PacketIn partagé par tous les modules du pipeline.
+    Le paquet est analysé une seule fois : chaque en-tête (ARP, IPv4,
+    TCP, UDP, ICMP) et chaque clé d'adresse n'est calculé qu'au premier
+    accès puis mis en cache.
+    Les adresses IP sont des chaînes internées (clés de dictionnaire rapides).
+    """
+
+    def __init__(self, event):
+        self.event = event
+        self.packet = event.parsed
+        self.connection = event.connection
+        self.dpid = event.dpid
+        self.in_port = event.port
+
+    # --------------------- L2 ---------------------
+    @property
+    def src_mac(self):
+        return self.packet.src
+
+    @property
+    def dst_mac(self):
+        return self.packet.dst
+
+    @cached_property
+    def is_arp(self):
+        return self.packet.type == ethernet.ARP_TYPE
+
+    # --------------------- L3 ---------------------
+    @cached_property
+    def arp(self):
+        return self.packet.find('arp') if self.is_arp else None
+
+    @cached_property
+    def ipv4(self):
+        if self.is_arp:
+            return None
+        return self.packet.find('ipv4')
+
+    @cached_property
+    def src_ip(self):
+        """IP source (en-tête IPv4, ou émetteur ARP)."""
+        if self.ipv4 is not None:
+            return sys.intern(self.ipv4.srcip.toStr())
+        if self.arp is not None:
+            return sys.intern(self.arp.protosrc.toStr())
+        return None
+
+    @cached_property
+    def dst_ip(self):
+        """IP destination (en-tête IPv4, ou cible ARP)."""
+        if self.ipv4 is not None:
+            return sys.intern(self.ipv4.dstip.toStr())
+        if self.arp is not None:
+            return sys.intern(self.arp.protodst.toStr())
+        return None
+
+    # --------------------- L4 ---------------------
+    @cached_property
+    def tcp(self):
+        return self.ipv4.find('tcp') if self.ipv4 is not None else None
+
+    @cached_property
+    def udp(self):
+        return self.ipv4.find('udp') if self.ipv4 is not None else None
+
+    @cached_property
+    def icmp(self):
+        return self.ipv4.find('icmp') if self.ipv4 is not None else None
+
+    # --------------------- Classification ---------------------
+    @cached_property
+    def traffic_class(self):
+        """Classe de trafic la plus précise du paquet (voir TRAFFIC_PARENTS)."""
+        if self.is_arp:
+            return "arp"
+        if self.ipv4 is None:
+            return "other"
+        if self.tcp is not None:
+            if self.tcp.SYN and not self.tcp.ACK:
+                return "tcp_syn"
+            return "tcp"
+        if self.udp is not None:
+            return "udp"
+        if self.icmp is not None:
+            return "icmp"
+        return "ipv4"
@@ -0,0 +1,163 @@
+import itertools
+import time
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+
+log = core.getLogger()
+
+MITIGATION_PRIORITY = 65535
+# Les cookies des règles DROP : préfixe fixe + identifiant de la règle
+MITIGATION_COOKIE = 0xd0 << 56
+
+# États d'une règle sur un switch
+PENDING = "pending"        # flow_mod envoyé, barrier pas encore acquittée
+INSTALLED = "installed"    # barrier acquittée : la règle est active
+
+
+def _openflow_connections():
+    return core.openflow._connections.values()
+
+
+class _Rule(object):
+    """Une règle DROP sur un switch."""
+    __slots__ = ("key", "cookie", "until", "state", "xid")
+
+    def __init__(self, key, cookie, until, xid):
+        self.key = key
+        self.cookie = cookie
+        self.until = until
+        self.state = PENDING
+        self.xid = xid
+
+
+class MitigationRegistry(object):
+    """
+    Registre, pour tout le contrôleur, des règles DROP installées ou en
+    cours d'installation sur chaque switch.
+      - chaque règle (switch, match) n'est envoyée qu'une fois, suivie d'une
+        barrier : une détection répétée ne coûte aucun message
+      - l'expiration est suivie grâce aux messages FlowRemoved
+        (et à la durée demandée si le message est perdu)
+      - les blocages globaux sont rejoués sur les switches qui se connectent
+    """
+
+    def __init__(self, clock=time.time, get_connections=None):
+        """
+        get_connections : fonction renvoyant les switches connectés
+                          (core.openflow par défaut)
+        """
+        self.clock = clock
+        self.get_connections = get_connections or _openflow_connections
+        self.rules = {}          # (dpid, clé) -> _Rule
+        self.cookies = {}        # (dpid, cookie) -> clé
+        self.barriers = {}       # (dpid, xid) -> clé
+        self.active = {}         # clé -> (match, until, raison) des blocages globaux
+        self._ids = itertools.count(1)
+
+        self.sent = 0            # flow_mods envoyés
+        self.skipped = 0         # blocages déjà en place (aucun message)
+
+    def start(self):
+        """Écoute les événements OpenFlow (barrier, FlowRemoved, connexions)."""
+        core.openflow.addListeners(self)
+
+    def _valid(self, rule, t):
+        return rule is not None and rule.until > t
+
+    def _forget(self, dpid, key):
+        rule = self.rules.pop((dpid, key), None)
+        if rule is not None:
+            self.cookies.pop((dpid, rule.cookie), None)
+            self.barriers.pop((dpid, rule.xid), None)
+
+    def is_blocked(self, key, dpid):
+        """Indique si la règle `key` est installée (ou en cours) sur `dpid`."""
+        return self._valid(self.rules.get((dpid, key)), self.clock())
+
+    def block(self, key, match, duration, connections=None, reason="inconnu"):
+        """
+        Installe une règle DROP `match` identifiée par `key`.
+        connections : switches visés (tous les switches si None ; le blocage
+                      est alors aussi appliqué aux switches qui se connectent)
+        Renvoie le nombre de switches sur lesquels la règle a été envoyée.
+        """
+        t = self.clock()
+        until = t + duration
+        if connections is None:
+            connections = list(self.get_connections())
+            entry = self.active.get(key)
+            if entry is None or entry[1] <= t:
+                self.active[key] = (match, until, reason)
+                self._expire_active(t)
+
+        count = 0
+        for conn in connections:
+            if self._valid(self.rules.get((conn.dpid, key)), t):
+                self.skipped += 1
+                continue
+            self._install(conn, key, match, duration, until)
+            count += 1
+
+        if count:
+            log.warning("Règle DROP %s envoyée à %d switch(es) pour %ss (raison : %s)",
+                        key, count, duration, reason)
+        return count
+
+    def _install(self, conn, key, match, duration, until):
+        """Envoie le flow DROP suivi d'une barrier sur un switch."""
+        self._forget(conn.dpid, key)
+        cookie = MITIGATION_COOKIE | next(self._ids)
+
+        msg = of.ofp_flow_mod()
+        msg.priority = MITIGATION_PRIORITY
+        msg.match = match
+        msg.actions = []                  # Aucune action → DROP
+        # 0 voudrait dire "permanent" pour le switch
+        msg.idle_timeout = max(1, int(duration))
+        msg.hard_timeout = max(1, int(duration))
+        msg.cookie = cookie
+        msg.flags = of.OFPFF_SEND_FLOW_REM
+        conn.send(msg)
+
+        barrier = of.ofp_barrier_request()
+        conn.send(barrier)
+        self.sent += 1
+
+        self.rules[(conn.dpid, key)] = _Rule(key, cookie, until, barrier.xid)
+        self.cookies[(conn.dpid, cookie)] = key
+        self.barriers[(conn.dpid, barrier.xid)] = key
+
+    def _expire_active(self, t):
+        for key in [k for k, e in self.active.items() if e[1] <= t]:
+            del self.active[key]
+
+    def _handle_BarrierIn(self, event):
+        key = self.barriers.pop((event.dpid, event.xid), None)
+        if key is None:
+            return
+        rule = self.rules.get((event.dpid, key))
+        if rule is not None:
+            rule.state = INSTALLED
+
+    def _handle_FlowRemoved(self, event):
+        cookie = event.ofp.cookie
+        if cookie & MITIGATION_COOKIE != MITIGATION_COOKIE:
+            return
+        key = self.cookies.get((event.dpid, cookie))
+        if key is None:
+            return
+        self._forget(event.dpid, key)
+        log.info("Règle DROP %s expirée sur le switch %s", key, event.dpid)
+
+    def _handle_ConnectionUp(self, event):
+        """Applique les blocages globaux encore actifs au nouveau switch."""
+        t = self.clock()
+        self._expire_active(t)
+        for key, (match, until, reason) in list(self.active.items()):
+            self._forget(event.dpid, key)
+            self._install(event.connection, key, match, until - t, until)
+
+    def _handle_ConnectionDown(self, event):
+        for dpid, key in [k for k in self.rules if k[0] == event.dpid]:
+            self._forget(dpid, key)
@@ -0,0 +1,166 @@
+import time
+import weakref
+from collections import OrderedDict
+
+# Toutes les tables créées (pour les statistiques)
+_tables = weakref.WeakSet()
+
+_MISSING = object()
+
+
+class StateTable(object):
+    """
+    Table d'état bornée pour les modules du firewall.
+      - capacité maximale : l'entrée la moins récemment utilisée est évincée
+        (LRU), ou, avec evict=False, les nouvelles clés sont refusées tant
+        que la table est pleine (les entrées apprises ne sont jamais
+        poussées dehors par des clés nouvelles)
+      - ttl : une entrée inutilisée depuis `ttl` secondes expire
+      - compteurs d'évictions (LRU / TTL) et de refus pour le suivi
+    Lire (get) ou écrire une entrée la rafraîchit.
+    Les entrées sont gardées dans l'ordre de dernière utilisation : les plus
+    anciennes sont en tête, l'expiration se fait donc en O(1) amorti.
+    """
+
+    def __init__(self, name, capacity, ttl=None, clock=time.time, evict=True):
+        """
+        name     : nom de la table (logs / statistiques)
+        capacity : nombre maximal d'entrées
+        ttl      : durée d'inactivité avant expiration (None = jamais)
+        evict    : table pleine -> éviction LRU (True) ou refus de la nouvelle clé
+        """
+        self.name = name
+        self.capacity = int(capacity)
+        self.ttl = ttl
+        self.clock = clock
+        self.evict = evict
+
+        self._entries = OrderedDict()  # clé -> [valeur, dernier accès]
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.refused = 0
+
+        _tables.add(self)
+
+    def _expired(self, entry, t):
+        return self.ttl is not None and t - entry[1] > self.ttl
+
+    def expire(self, t=None):
+        """Supprime les entrées expirées en tête de table. Renvoie leur nombre."""
+        if self.ttl is None:
+            return 0
+        if t is None:
+            t = self.clock()
+        removed = 0
+        entries = self._entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if not self._expired(entry, t):
+                break
+            del entries[key]
+            removed += 1
+        self.evicted_ttl += removed
+        return removed
+
+    def _lookup(self, key, t):
+        """Renvoie l'entrée de `key` si elle est encore valide."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, t):
+            del self._entries[key]
+            self.evicted_ttl += 1
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        """Lit une valeur et rafraîchit l'entrée."""
+        t = self.clock()
+        entry = self._lookup(key, t)
+        if entry is None:
+            return default
+        entry[1] = t
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """Lit une valeur sans rafraîchir l'entrée."""
+        entry = self._lookup(key, self.clock())
+        return default if entry is None else entry[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def set(self, key, value):
+        """
+        Écrit une valeur et rafraîchit l'entrée. Renvoie False si la clé
+        est nouvelle et refusée (table pleine, evict=False).
+        """
+        t = self.clock()
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None:
+            entry[0] = value
+            entry[1] = t
+            entries.move_to_end(key)
+            return True
+
+        self.expire(t)
+        if not self.evict and len(entries) >= self.capacity:
+            self.refused += 1
+            return False
+        entries[key] = [value, t]
+        while len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evicted_lru += 1
+        return True
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        del self._entries[key]
+
+    def __contains__(self, key):
+        return self._lookup(key, self.clock()) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            return default
+        return value
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def items(self):
+        """Copie des couples (clé, valeur) non expirés."""
+        self.expire()
+        return [(k, e[0]) for k, e in self._entries.items()]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Taille et compteurs d'évictions de la table."""
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "refused": self.refused,
+        }
+
+
+def all_stats():
+    """Statistiques de toutes les tables vivantes."""
+    return [t.stats() for t in list(_tables)]
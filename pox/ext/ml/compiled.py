@@ -0,0 +1,200 @@
+"""
+Évaluation rapide d'un IsolationForest entraîné (ml/train.py).
+
+Les arbres du modèle sklearn sont aplatis dans quelques tableaux NumPy
+(feature, seuil, fils gauche/droit, valeur de feuille par nœud). Les petits
+batches parcourent tous les arbres en même temps (parcours vectorisé) ; les
+grands passent arbre par arbre dans tree_.apply (Cython), sans le surcoût
+joblib de sklearn. Les résultats sont identiques bit à bit à
+score_samples / predict.
+
+Vérification et benchmark (depuis pox/ext) :
+  python3 -m ml.compiled [nombre_de_lignes_de_test]
+"""
+import time
+
+import numpy as np
+from sklearn.ensemble._iforest import _average_path_length
+
+# À partir de ce nombre de lignes, tree_.apply (arbre par arbre) est plus
+# rapide que le parcours vectorisé de tous les arbres
+APPLY_MIN_ROWS = 64
+
+
+def _node_depths(left, right):
+    """Profondeur de chaque nœud d'un arbre (racine = 1)."""
+    depths = np.zeros(len(left), dtype=np.float64)
+    depths[0] = 1.0
+    for node in range(len(left)):       # les fils sont après leur parent
+        if left[node] != -1:
+            depths[left[node]] = depths[node] + 1.0
+            depths[right[node]] = depths[node] + 1.0
+    return depths
+
+
+class CompiledForest(object):
+    """
+    IsolationForest aplati : mêmes score_samples, decision_function et
+    predict que le modèle sklearn, sans surcoût par appel ni par arbre.
+      - X est converti en float32 comme dans sklearn
+      - la contribution d'un arbre est (profondeur + c(n_node_samples)) - 1
+        pour la feuille atteinte, précalculée par nœud
+      - les contributions sont additionnées arbre par arbre, dans l'ordre
+        des estimateurs (même ordre d'arrondi que sklearn)
+    """
+
+    def __init__(self, model):
+        self.offset_ = model.offset_
+        self.n_features_in_ = model.n_features_in_
+        self.n_estimators = len(model.estimators_)
+        subsample = model._max_features != model.n_features_in_
+
+        features, thresholds, children, missing, values, roots = [], [], [], [], [], []
+        self.trees = []     # (tree_, features du sous-échantillon ou None)
+        self.max_depth = 0
+        base = 0
+        for est, est_features in zip(model.estimators_, model.estimators_features_):
+            tree = est.tree_
+            left = tree.children_left
+            right = tree.children_right
+            leaf = left == -1
+            n = tree.node_count
+
+            feature = np.where(leaf, 0, tree.feature)
+            if subsample:
+                feature = np.asarray(est_features)[feature]
+            features.append(feature)
+            thresholds.append(tree.threshold)
+            # Direction des NaN choisie par sklearn (à droite si absente)
+            nodes_state = tree.__getstate__()["nodes"]
+            if "missing_go_to_left" in nodes_state.dtype.names:
+                missing.append(nodes_state["missing_go_to_left"].astype(bool))
+            else:
+                missing.append(np.zeros(n, dtype=bool))
+            # Fils du nœud i en 2i (droit) et 2i + 1 (gauche). Une feuille
+            # boucle sur elle-même : le parcours peut continuer sans effet
+            # jusqu'à la profondeur maximale de la forêt
+            nodes = np.arange(n)
+            pairs = np.empty((n, 2), dtype=np.int64)
+            pairs[:, 0] = np.where(leaf, nodes, right) + base
+            pairs[:, 1] = np.where(leaf, nodes, left) + base
+            children.append(pairs.ravel())
+
+            depths = _node_depths(left, right)
+            values.append(depths + _average_path_length(tree.n_node_samples) - 1.0)
+            roots.append(base)
+            self.trees.append((tree, np.asarray(est_features) if subsample else None))
+            self.max_depth = max(self.max_depth, int(depths.max()) - 1)
+            base += n
+
+        self.feature = np.concatenate(features).astype(np.int32)
+        self.threshold = np.concatenate(thresholds)
+        self.children = np.concatenate(children).astype(np.int32)
+        self.missing_left = np.concatenate(missing)
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.int32)
+        self.denominator = (self.n_estimators
+                            * _average_path_length([model._max_samples])[0])
+
+    def _leaves(self, X):
+        """Feuille atteinte dans chaque arbre : matrice (n_arbres, n_lignes)."""
+        n = X.shape[0]
+        has_nan = np.isnan(X).any()
+        # Colonnes contiguës : la valeur (ligne i, feature f) est en f * n + i
+        columns = np.ascontiguousarray(X.T).ravel()
+        rows = np.arange(n, dtype=np.int32)
+        node = np.repeat(self.roots[:, None], n, axis=1)
+        for _ in range(self.max_depth):
+            x = columns[self.feature[node] * n + rows]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[node]
+            node = self.children[2 * node + go_left]
+        return node
+
+    def _path_lengths(self, X):
+        """Somme, arbre par arbre, des longueurs de chemin de chaque ligne."""
+        n = X.shape[0]
+        depths = np.zeros(n)
+        if n < APPLY_MIN_ROWS:
+            for tree_values in self.value[self._leaves(X)]:
+                depths += tree_values
+            return depths
+
+        X = np.ascontiguousarray(X)
+        for root, (tree, features) in zip(self.roots, self.trees):
+            leaves = tree.apply(X if features is None else X[:, features])
+            depths += self.value[leaves + root]
+        return depths
+
+    def score_samples(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        n = X.shape[0]
+        depths = self._path_lengths(X)
+        if self.denominator == 0:
+            # Un seul échantillon d'entraînement : sklearn fixe 2 ** -1
+            return -np.full(n, 0.5)
+        return -(2 ** (-(depths / self.denominator)))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        is_inlier = np.ones(len(X), dtype=int)
+        is_inlier[self.decision_function(X) < 0] = -1
+        return is_inlier
+
+
+def verify(model, X):
+    """
+    Compare le modèle compilé au modèle sklearn sur X : lève AssertionError
+    si score_samples ou predict diffèrent (comparaison bit à bit).
+    """
+    compiled = CompiledForest(model)
+    expected = model.score_samples(X)
+    got = compiled.score_samples(X)
+    assert np.array_equal(expected, got), \
+        "score_samples différent sur %d lignes (écart max %g)" % (
+            int((expected != got).sum()), float(np.abs(expected - got).max()))
+    assert np.array_equal(model.predict(X), compiled.predict(X)), "predict différent"
+    return compiled
+
+
+def _bench(model, compiled, X, sizes=(1, 100, 10000), repeat=5):
+    for size in sizes:
+        batch = X[:size]
+        timings = []
+        for predict in (model.predict, compiled.predict):
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                predict(batch)
+                best = min(best, time.perf_counter() - t0)
+            timings.append(best)
+        print("batch %6d : sklearn %9.2f ms   compilé %9.2f ms   (x%.1f)"
+              % (size, timings[0] * 1e3, timings[1] * 1e3, timings[0] / timings[1]))
+
+
+if __name__ == "__main__":
+    import sys
+    import warnings
+    from sklearn.ensemble import IsolationForest
+    from .utils import load_model, FEATURE_COLUMNS
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = np.random.default_rng(0)
+    try:
+        model, scaler = load_model()
+        print("Modèle : %s (%d arbres)" % (type(model).__name__, len(model.estimators_)))
+    except (IOError, OSError):
+        # Pas de modèle entraîné : forêt de la taille de ml/train.py sur du bruit
+        model = IsolationForest(n_estimators=300, contamination=0.001, random_state=42)
+        model.fit(rng.normal(size=(20000, len(FEATURE_COLUMNS))))
+        print("Modèle : IsolationForest de test (300 arbres)")
+
+    X = rng.normal(scale=2.0, size=(rows, model.n_features_in_))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")    # noms de colonnes absents de X
+        compiled = verify(model, X)
+        print("Vérification OK : score_samples et predict identiques sur %d lignes" % rows)
+        _bench(model, compiled, X)
@@ -0,0 +1,84 @@
+import numpy as np
+
+from .utils import FEATURE_COLUMNS
+
+# Règles par défaut : feature=seuil (la source est suspecte si une feature
+# atteint son seuil)
+GATE_RULES = "pkts_per_sec=20,syn_ratio=0.8,mac_changes=1,arp_rep=5"
+AUDIT_RATE = 0.05     # part des sources non suspectes évaluées quand même
+
+
+def parse_rules(text):
+    """ "pkts_per_sec=20,syn_ratio=0.8" -> {"pkts_per_sec": 20.0, ...} """
+    rules = {}
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition("=")
+        if name not in FEATURE_COLUMNS:
+            raise ValueError("Feature inconnue dans la règle : %s" % item)
+        rules[name] = float(value)
+    return rules
+
+
+class Gate(object):
+    """
+    Premier étage de détection, avant le modèle : des règles simples sur
+    les features du snapshot désignent les sources suspectes. Seules
+    celles-ci, plus un échantillon aléatoire des autres (audit), sont
+    envoyées au modèle. Sans règle, toutes les sources sont évaluées.
+    Compteurs cumulés par étage : sources vues, suspectes, auditées,
+    laissées passer sans évaluation, déclenchements de chaque règle et
+    anomalies trouvées par l'audit (audit_hits, à tenir à jour par
+    l'appelant : s'il augmente, les règles laissent passer des anomalies).
+    """
+
+    def __init__(self, rules, audit_rate=AUDIT_RATE, seed=None):
+        """rules : {feature: seuil}"""
+        self.rules = [(name, FEATURE_COLUMNS.index(name), threshold)
+                      for name, threshold in rules.items()]
+        self.audit_rate = audit_rate
+        self.rng = np.random.default_rng(seed)
+
+        self.seen = 0
+        self.flagged = 0
+        self.audited = 0
+        self.passed = 0
+        self.audit_hits = 0   # anomalies trouvées par le modèle dans l'audit
+        self.hits = dict((name, 0) for name in rules)
+
+    def select(self, X):
+        """
+        Lignes de X à évaluer par le modèle : (indices, masque des lignes
+        retenues seulement pour l'audit).
+        """
+        n = len(X)
+        if self.rules:
+            flagged = np.zeros(n, dtype=bool)
+            for name, col, threshold in self.rules:
+                hit = X[:, col] >= threshold
+                self.hits[name] += int(hit.sum())
+                flagged |= hit
+        else:
+            flagged = np.ones(n, dtype=bool)
+        audit = ~flagged & (self.rng.random(n) < self.audit_rate)
+        rows = np.flatnonzero(flagged | audit)
+
+        n_flagged = int(flagged.sum())
+        n_audit = int(audit.sum())
+        self.seen += n
+        self.flagged += n_flagged
+        self.audited += n_audit
+        self.passed += n - n_flagged - n_audit
+        return rows, audit[rows]
+
+    def stats(self):
+        return {
+            "seen": self.seen,
+            "flagged": self.flagged,
+            "audited": self.audited,
+            "passed": self.passed,
+            "audit_hits": self.audit_hits,
+            "hits": dict(self.hits),
+        }
@@ -0,0 +1,177 @@
+import csv
+import glob
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .utils import DIR_FEATURES, FEATURE_HEADER, FEATURE_COLUMNS
+
+SINK_FORMATS = "csv,npz"
+FLUSH_ROWS = 5000             # lignes en mémoire avant envoi au writer
+FLUSH_SECONDS = 10.0          # ... ou délai maximal avant envoi
+ROTATE_BYTES = 64 << 20       # taille d'un segment avant rotation
+ROTATE_SECONDS = 3600.0       # durée d'un segment avant rotation
+
+
+class FeatureSink(object):
+    """
+    Écriture des snapshots de features sans bloquer la boucle POX :
+      - write() ne fait que garder les lignes en mémoire
+      - par paquets (FLUSH_ROWS lignes ou FLUSH_SECONDS), un thread
+        d'écriture les ajoute aux fichiers, qui restent ouverts
+      - formats : "csv" (une ligne par source, FEATURE_HEADER) et/ou "npz"
+        (un fichier NumPy par paquet : timestamp, src_ip, X, columns),
+        relu sans analyse de texte par ml/train.py
+      - les lignes ne restent pas indéfiniment en mémoire si l'appelant
+        appelle flush_due() régulièrement (snapshots arrêtés)
+      - chaque échec d'écriture (disque plein, droits...) est journalisé
+        par `log` (logger POX) et compté (errors, last_error)
+      - rotation des fichiers par taille et par âge :
+        <directory>/<name>-<date>-<segment>.csv et ...-<segment>-<n>.npz
+    """
+
+    def __init__(self, directory=DIR_FEATURES, name="features", formats=SINK_FORMATS,
+                 flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS,
+                 rotate_bytes=ROTATE_BYTES, rotate_seconds=ROTATE_SECONDS,
+                 clock=time.time, log=None):
+        self.directory = directory
+        self.name = name
+        self.formats = set(f.strip() for f in formats.split(",") if f.strip())
+        unknown = self.formats - set(("csv", "npz"))
+        if unknown:
+            raise ValueError("Format de features inconnu : %s" % ", ".join(unknown))
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.clock = clock
+        self.log = log
+
+        # Côté boucle POX
+        self._pending = []            # (timestamp, ips, X) en attente
+        self._pending_rows = 0
+        self._last_flush = clock()
+
+        # Côté thread d'écriture
+        self._segment = None          # préfixe des fichiers du segment courant
+        self._segment_start = 0.0
+        self._segment_bytes = 0
+        self._chunk = 0
+        self._csv_file = None
+        self._csv = None
+
+        self.rows = 0                 # lignes écrites
+        self.chunks = 0               # paquets écrits
+        self.errors = 0
+        self.last_error = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="FeatureSink")
+        self._thread.daemon = True
+        self._thread.start()
+
+    # --------------------- Boucle POX ---------------------
+
+    def write(self, ips, X, t=None):
+        """Ajoute les features d'un snapshot (X est copiée)."""
+        if not len(ips):
+            return
+        t = self.clock() if t is None else t
+        self._pending.append((t, list(ips), np.array(X)))
+        self._pending_rows += len(ips)
+        if (self._pending_rows >= self.flush_rows
+                or t - self._last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush_due(self):
+        """Envoie les lignes en attente depuis plus de flush_seconds."""
+        if self._pending and self.clock() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Envoie les lignes en attente au thread d'écriture."""
+        self._last_flush = self.clock()
+        if self._pending:
+            self._queue.put(self._pending)
+            self._pending = []
+            self._pending_rows = 0
+
+    def close(self):
+        """Écrit tout ce qui reste et arrête le thread."""
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    # --------------------- Thread d'écriture ---------------------
+
+    def _run(self):
+        while True:
+            pieces = self._queue.get()
+            if pieces is None:
+                break
+            try:
+                self._write_chunk(pieces)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+                if self.log is not None:
+                    # logging est utilisable depuis ce thread
+                    self.log.error("%s : %d lignes de features perdues (%s)",
+                                   self.name, sum(len(p[1]) for p in pieces), e)
+        self._close_segment()
+
+    def _open_segment(self, t):
+        self._close_segment()
+        prefix = os.path.join(
+            self.directory, self.name + "-" + time.strftime("%Y%m%d-%H%M%S", time.localtime(t)))
+        n = 0
+        while glob.glob("%s-%02d*" % (prefix, n)):
+            n += 1
+        self._segment = "%s-%02d" % (prefix, n)
+        self._segment_start = t
+        self._segment_bytes = 0
+        self._chunk = 0
+        if "csv" in self.formats:
+            path = self._segment + ".csv"
+            self._csv_file = open(path, "w", newline="")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(FEATURE_HEADER)
+
+    def _close_segment(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv = None
+
+    def _write_chunk(self, pieces):
+        t0 = pieces[0][0]
+        if (self._segment is None
+                or self._segment_bytes >= self.rotate_bytes
+                or t0 - self._segment_start >= self.rotate_seconds):
+            self._open_segment(t0)
+
+        timestamps = np.concatenate([np.full(len(ips), t) for t, ips, _ in pieces])
+        ips = [ip for _, chunk_ips, _ in pieces for ip in chunk_ips]
+        X = np.concatenate([x for _, _, x in pieces])
+
+        if self._csv is not None:
+            start = self._csv_file.tell()
+            for t, ip, values in zip(timestamps.tolist(), ips, X.tolist()):
+                self._csv.writerow([t, ip] + values)
+            self._csv_file.flush()
+            self._segment_bytes += self._csv_file.tell() - start
+
+        if "npz" in self.formats:
+            self._chunk += 1
+            path = "%s-%04d.npz" % (self._segment, self._chunk)
+            np.savez(path, timestamp=timestamps, src_ip=np.array(ips),
+                     X=X, columns=np.array(FEATURE_COLUMNS))
+            self._segment_bytes += os.path.getsize(path)
+
+        self.rows += len(ips)
+        self.chunks += 1
+
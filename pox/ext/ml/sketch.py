@@ -0,0 +1,283 @@
+import math
+from array import array
+
+import numpy as np
+
+M64 = (1 << 64) - 1
+
+HLL_ERROR = 0.08          # erreur relative visée par défaut : 2**8 registres
+HLL_MIN_PRECISION = 4
+HLL_MAX_PRECISION = 16
+HLL_CACHE_SIZE = 1 << 16  # valeurs dont (registre, rang) est gardé en cache
+
+TOPK_COUNTERS = 8         # valeurs suivies par slot pour les entropies
+
+
+def mix64(x):
+    """Finaliseur splitmix64 : disperse hash(x) sur 64 bits."""
+    x = (x + 0x9E3779B97F4A7C15) & M64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & M64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & M64
+    return x ^ (x >> 31)
+
+
+def hll_precision(error):
+    """Nombre de bits d'index p tel que 1.04 / sqrt(2**p) <= error."""
+    p = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(p, HLL_MIN_PRECISION), HLL_MAX_PRECISION)
+
+
+def _alpha(m):
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class ExactColumn(object):
+    """Nombre exact de valeurs distinctes par slot (un set Python par slot)."""
+
+    def __init__(self, capacity):
+        self.sets = [None] * capacity     # slot -> set (None = vide)
+
+    def grow(self, capacity):
+        self.sets += [None] * (capacity - len(self.sets))
+
+    def add(self, slot, value):
+        values = self.sets[slot]
+        if values is None:
+            values = self.sets[slot] = set()
+        values.add(value)
+
+    def reset(self, slots):
+        for slot in slots:
+            self.sets[slot] = None
+
+    def take(self, slots):
+        """Contenu des slots pour un bucket de fenêtre (les sets, sans copie)."""
+        sets = self.sets
+        return [sets[s] for s in slots]
+
+    def merged_estimate(self, parts, n):
+        """
+        Valeurs distinctes de n sources sur plusieurs buckets : `parts`
+        liste de (ligne de chaque slot dans le résultat, take() du bucket).
+        Taille de l'union des sets de chaque source.
+        """
+        union = [None] * n
+        for rows, sets in parts:
+            for row, values in zip(rows.tolist(), sets):
+                if values:
+                    current = union[row]
+                    union[row] = values if current is None else current | values
+        return np.fromiter((len(u) if u else 0 for u in union), dtype=np.float64, count=n)
+
+
+class HLLColumn(object):
+    """
+    Nombre approché de valeurs distinctes par slot (HyperLogLog) :
+    2**precision registres d'un octet par slot, quel que soit le nombre de
+    valeurs vues. Erreur relative typique : 1.04 / sqrt(2**precision).
+    Les registres de tous les slots sont rangés dans un seul bytearray.
+    """
+
+    def __init__(self, capacity, error=HLL_ERROR):
+        self.precision = hll_precision(error)
+        self.m = 1 << self.precision
+        self.error = 1.04 / math.sqrt(self.m)
+        self._shift = 64 - self.precision
+        self._low = (1 << self._shift) - 1
+        self.registers = bytearray(capacity * self.m)
+        # Les mêmes destinations reviennent d'un paquet à l'autre : le
+        # couple (registre, rang) d'une valeur n'est calculé qu'une fois
+        self._codes = {}
+
+    def grow(self, capacity):
+        self.registers += bytes(capacity * self.m - len(self.registers))
+
+    def _code(self, value):
+        h = mix64(hash(value) & M64)
+        # Rang du premier bit à 1 dans les bits qui ne servent pas d'index
+        code = (h >> self._shift, self._shift - (h & self._low).bit_length() + 1)
+        if len(self._codes) >= HLL_CACHE_SIZE:
+            self._codes.clear()
+        self._codes[value] = code
+        return code
+
+    def add(self, slot, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._code(value)
+        i = (slot << self.precision) + code[0]
+        if code[1] > self.registers[i]:
+            self.registers[i] = code[1]
+
+    def _rows(self, slots):
+        regs = np.frombuffer(self.registers, dtype=np.uint8).reshape(-1, self.m)
+        return regs[slots]
+
+    def _estimate(self, R):
+        m = self.m
+        Z = np.exp2(-R.astype(np.float64)).sum(axis=1)
+        E = _alpha(m) * m * m / Z
+        # Petites cardinalités : comptage linéaire sur les registres vides
+        V = (R == 0).sum(axis=1)
+        small = (E <= 2.5 * m) & (V > 0)
+        E[small] = m * np.log(m / V[small])
+        return E
+
+    def reset(self, slots):
+        if slots:
+            regs = np.frombuffer(self.registers, dtype=np.uint8).reshape(-1, self.m)
+            regs[slots] = 0
+
+    def take(self, slots):
+        """Registres des slots (copie) pour un bucket de fenêtre."""
+        return self._rows(slots)
+
+    def merged_estimate(self, parts, n):
+        """
+        Valeurs distinctes de n sources sur plusieurs buckets (voir
+        ExactColumn.merged_estimate) : l'union de sketches HyperLogLog est
+        le max de leurs registres.
+        """
+        R = np.zeros((n, self.m), dtype=np.uint8)
+        for rows, regs in parts:
+            R[rows] = np.maximum(R[rows], regs)
+        return self._estimate(R)
+
+
+class TopKColumn(object):
+    """
+    Fréquences des valeurs par slot (SpaceSaving) : les k valeurs les plus
+    fréquentes, leur compte et l'erreur maximale de ce compte.
+    Mémoire fixe par slot (k clés + 2k compteurs), mise à jour en O(k) avec
+    k petit. Quand la table est pleine, une nouvelle valeur remplace la
+    moins fréquente et hérite de son compte (surestimation bornée).
+    """
+
+    def __init__(self, capacity, k=TOPK_COUNTERS):
+        self.k = k
+        self.keys = [None] * capacity                   # slot -> hash des valeurs suivies
+        self.counts = array("q", bytes(8 * k * capacity))
+        self.errors = array("q", bytes(8 * k * capacity))
+
+    def grow(self, capacity):
+        extra = capacity - len(self.keys)
+        self.keys += [None] * extra
+        self.counts.frombytes(bytes(8 * self.k * extra))
+        self.errors.frombytes(bytes(8 * self.k * extra))
+
+    def add(self, slot, value):
+        # Valeurs suivies par leur hash (64 bits) : fusion vectorisée des buckets
+        value = hash(value)
+        keys = self.keys[slot]
+        base = slot * self.k
+        if keys is None:
+            self.keys[slot] = [value]
+            self.counts[base] = 1
+            return
+        if value in keys:
+            self.counts[base + keys.index(value)] += 1
+            return
+        n = len(keys)
+        if n < self.k:
+            keys.append(value)
+            self.counts[base + n] = 1
+            return
+        counts = self.counts[base:base + n]
+        j = counts.index(min(counts))
+        floor = counts[j]
+        keys[j] = value
+        self.counts[base + j] = floor + 1
+        self.errors[base + j] = floor
+
+    def _rows(self, values, slots):
+        return np.frombuffer(values, dtype=np.int64).reshape(-1, self.k)[slots]
+
+    def reset(self, slots):
+        if slots:
+            for slot in slots:
+                self.keys[slot] = None
+            view = np.frombuffer(self.counts, dtype=np.int64).reshape(-1, self.k)
+            view[slots] = 0
+            view = np.frombuffer(self.errors, dtype=np.int64).reshape(-1, self.k)
+            view[slots] = 0
+
+    def take(self, slots):
+        """(clés, comptes, erreurs) des slots, en matrices (n, k), pour un bucket de fenêtre."""
+        codes = np.zeros((len(slots), self.k), dtype=np.int64)
+        keys = self.keys
+        for row, slot in enumerate(slots):
+            values = keys[slot]
+            if values:
+                codes[row, :len(values)] = values
+        return (codes, self._rows(self.counts, slots), self._rows(self.errors, slots))
+
+    def merged_entropy(self, parts, n, distinct):
+        """
+        Entropie de n sources sur plusieurs buckets (voir
+        ExactColumn.merged_estimate) : comptes et erreurs des mêmes valeurs
+        additionnés, k plus fréquentes gardées (fusion de résumés
+        SpaceSaving). Le total de paquets reste exact.
+        """
+        rows = np.concatenate([r for r, _ in parts])
+        codes = np.concatenate([p[0] for _, p in parts])
+        counts = np.concatenate([p[1] for _, p in parts])
+        errors = np.concatenate([p[2] for _, p in parts])
+        N = np.bincount(rows, counts.sum(axis=1), n)
+
+        L = np.zeros((n, self.k))
+        used = counts > 0
+        if not used.any():
+            # Aucune valeur vue (sources ARP seulement)
+            return _entropy(L, np.zeros(n), N, distinct)
+
+        # Une entrée par (source, valeur) : comptes additionnés
+        g = np.broadcast_to(rows[:, None], counts.shape)[used]
+        key = codes[used]
+        order = np.lexsort((key, g))
+        g, key = g[order], key[order]
+        first = np.flatnonzero(np.r_[True, (g[1:] != g[:-1]) | (key[1:] != key[:-1])])
+        g = g[first]
+        C = np.add.reduceat(counts[used][order], first)
+        E = np.add.reduceat(errors[used][order], first)
+
+        # k valeurs les plus fréquentes de chaque source
+        order = np.lexsort((-C, g))
+        g, C, E = g[order], C[order], E[order]
+        group_start = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+        rank = np.arange(len(g)) - np.repeat(group_start, np.diff(np.append(group_start, len(g))))
+        keep = rank < self.k
+        L[g[keep], rank[keep]] = (C - E)[keep]
+        tracked = np.bincount(g[keep], minlength=n)
+        return _entropy(L, tracked, N, distinct)
+
+
+def _entropy(L, tracked, N, distinct):
+    """
+    Entropie (bits) par ligne : L comptes garantis des valeurs suivies,
+    `tracked` nombre de valeurs suivies, N total des paquets, `distinct`
+    estimation du nombre de valeurs distinctes.
+    """
+    P = np.divide(L, N[:, None], out=np.zeros_like(L), where=N[:, None] > 0)
+    H = -(P * np.log2(P, out=np.zeros_like(P), where=P > 0)).sum(axis=1)
+
+    # Masse non attribuée aux valeurs suivies
+    rest = np.maximum(distinct - tracked, 1)
+    q = np.divide(N - L.sum(axis=1), N, out=np.zeros_like(N), where=N > 0)
+    u = q / rest
+    H -= q * np.log2(u, out=np.zeros_like(u), where=u > 0)
+    return H
+
+
+def distinct_column(kind, capacity, error=HLL_ERROR):
+    """Colonne de comptage des valeurs distinctes : "exact" ou "hll"."""
+    if kind == "exact":
+        return ExactColumn(capacity)
+    if kind == "hll":
+        return HLLColumn(capacity, error)
+    raise ValueError("Comptage des valeurs distinctes inconnu : %s" % kind)
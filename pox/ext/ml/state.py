@@ -0,0 +1,284 @@
+from array import array
+from collections import deque
+
+import numpy as np
+
+from .utils import FEATURE_COLUMNS
+from .sketch import distinct_column, TopKColumn, HLL_ERROR
+
+# Colonnes de la table d'état (une ligne de N_COLUMNS doubles par source)
+(PKT_COUNT, BYTE_COUNT,
+ TCP_COUNT, UDP_COUNT, SYN_COUNT, ACK_COUNT, FIN_COUNT, RST_COUNT,
+ FLOWS, INCOMPLETE_FLOWS,
+ ARP_REQ, ARP_REP, MAC_CHANGES,
+ SIZE_N, SIZE_MEAN, SIZE_M2,       # agrégat de Welford des tailles
+ IAS_N, IAS_MEAN, IAS_M2,          # ... des temps inter-arrivées
+ TTL_N, TTL_MEAN, TTL_M2,          # ... des TTL
+ LAST_TIME, FIRST_TIME) = range(24)
+N_COLUMNS = 24
+
+# Colonnes qui s'additionnent d'un bucket à l'autre (PKT_COUNT..MAC_CHANGES)
+SUM_COLUMNS = MAC_CHANGES + 1
+
+INITIAL_SLOTS = 1024     # lignes allouées au départ (doublées si besoin)
+MAX_SLOTS = 1 << 18      # au-delà, les nouvelles sources sont ignorées
+IDLE_TICKS = 12          # resets sans trafic avant de libérer une source
+
+ARP_REQUEST = 1          # arp.REQUEST
+ARP_REPLY = 2            # arp.REPLY
+
+# Position de chaque feature dans la matrice de features (fill_features)
+_F = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+
+
+def _welford(d, i, x):
+    """Ajoute x à l'agrégat [n, moyenne, M2] rangé à partir de l'indice `i`."""
+    n = d[i] + 1.0
+    mean = d[i + 1]
+    delta = x - mean
+    mean += delta / n
+    d[i] = n
+    d[i + 1] = mean
+    d[i + 2] += delta * (x - mean)
+
+
+def _ratio(a, b):
+    """a / b élément par élément, 0 là où b est nul."""
+    return np.divide(a, b, out=np.zeros_like(a), where=b > 0)
+
+
+def _std(n, m2):
+    """Écart-type (population) des agrégats, 0 avec moins de 2 valeurs."""
+    return np.sqrt(np.divide(m2, n, out=np.zeros_like(m2), where=n > 1))
+
+
+def fill_features(X, D, window, dst_ips, dst_ports, entropy_dst_ports, entropy_dst_ips):
+    """
+    Remplit X (n, len(FEATURE_COLUMNS)) à partir des lignes D (n, N_COLUMNS)
+    de n sources sur une fenêtre de `window` secondes, et des estimations
+    par source des destinations distinctes et de leurs entropies.
+    """
+    pkt_count = D[:, PKT_COUNT]
+    byte_count = D[:, BYTE_COUNT]
+    X[:, _F["pkt_count"]] = pkt_count
+    X[:, _F["byte_count"]] = byte_count
+    X[:, _F["pkts_per_sec"]] = pkt_count / window
+    X[:, _F["bytes_per_sec"]] = byte_count / window
+    X[:, _F["unique_dst_ips"]] = dst_ips
+    X[:, _F["unique_dst_ports"]] = dst_ports
+    X[:, _F["avg_pkt_size"]] = _ratio(byte_count, pkt_count)
+    X[:, _F["std_pkt_size"]] = _std(D[:, SIZE_N], D[:, SIZE_M2])
+
+    std_ias = _std(D[:, IAS_N], D[:, IAS_M2])
+    X[:, _F["std_ias"]] = std_ias
+    X[:, _F["burstiness"]] = _ratio(std_ias, D[:, IAS_MEAN])
+
+    for name, col in (("tcp_count", TCP_COUNT), ("udp_count", UDP_COUNT),
+                      ("syn_count", SYN_COUNT), ("ack_count", ACK_COUNT),
+                      ("fin_count", FIN_COUNT), ("rst_count", RST_COUNT),
+                      ("flows", FLOWS), ("arp_req", ARP_REQ),
+                      ("arp_rep", ARP_REP), ("mac_changes", MAC_CHANGES)):
+        X[:, _F[name]] = D[:, col]
+    X[:, _F["syn_ratio"]] = _ratio(D[:, SYN_COUNT], D[:, TCP_COUNT])
+    X[:, _F["incomplete_flow_ratio"]] = _ratio(D[:, INCOMPLETE_FLOWS], D[:, FLOWS])
+
+    X[:, _F["ttl_mean"]] = D[:, TTL_MEAN]
+    X[:, _F["ttl_std"]] = _std(D[:, TTL_N], D[:, TTL_M2])
+
+    X[:, _F["entropy_dst_ports"]] = entropy_dst_ports
+    X[:, _F["entropy_dst_ips"]] = entropy_dst_ips
+
+
+class StateStore(object):
+    """
+    Table d'état compacte des sources IP (remplace le dict de dicts) :
+      - chaque IP source reçoit un numéro de ligne (slot) ; ses compteurs et
+        agrégats sont rangés dans un tableau contigu de doubles (array),
+        vu comme une matrice NumPy pour les calculs sur toute la table
+      - reset() ne remet à zéro que les lignes actives depuis le dernier reset
+      - une source silencieuse pendant `idle_ticks` resets libère sa ligne,
+        réutilisée par la prochaine nouvelle source
+      - take() renvoie le contenu des sources actives d'un bucket ; les
+        features sont calculées à partir des buckets par WindowRing
+    Les destinations distinctes (IP, ports) sont comptées exactement (un set
+    par source) ou, avec distinct="hll", par un sketch HyperLogLog de taille
+    fixe par source (erreur relative `distinct_error`).
+    Les entropies des destinations sont estimées à partir des fréquences
+    par paquet des valeurs les plus vues (TopKColumn, mémoire fixe).
+    """
+
+    def __init__(self, capacity=INITIAL_SLOTS, max_slots=MAX_SLOTS,
+                 idle_ticks=IDLE_TICKS, distinct="exact", distinct_error=HLL_ERROR):
+        self.max_slots = max_slots
+        self.idle_ticks = idle_ticks
+
+        # Mise à jour par paquet sur l'array (accès scalaire rapide),
+        # calculs vectorisés sur une vue NumPy temporaire (_matrix)
+        self.data = array("d", bytes(8 * N_COLUMNS * capacity))
+        self.last_tick = [0] * capacity
+        self.slots = {}                    # IP -> slot
+        self.ips = [None] * capacity       # slot -> IP
+        self.last_mac = [None] * capacity
+        self.dst_ips = distinct_column(distinct, capacity, distinct_error)
+        self.dst_ports = distinct_column(distinct, capacity, distinct_error)
+        self.dst_ip_freq = TopKColumn(capacity)
+        self.dst_port_freq = TopKColumn(capacity)
+        self.free = list(range(capacity - 1, -1, -1))
+
+        self.active = []        # slots ayant reçu un paquet depuis le dernier reset
+        self.history = deque()  # (tick, slots actifs) des derniers resets
+        self.tick = 0
+        self.overflow = 0       # paquets ignorés faute de place
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _grow(self):
+        old = len(self.ips)
+        new = min(old * 2, self.max_slots)
+        if new <= old:
+            return False
+        self.data.frombytes(bytes(8 * N_COLUMNS * (new - old)))
+        self.last_tick += [0] * (new - old)
+        extra = [None] * (new - old)
+        self.ips += extra
+        self.last_mac += extra
+        self.dst_ips.grow(new)
+        self.dst_ports.grow(new)
+        self.dst_ip_freq.grow(new)
+        self.dst_port_freq.grow(new)
+        self.free.extend(range(new - 1, old - 1, -1))
+        return True
+
+    def _matrix(self):
+        """Vue NumPy (capacité, N_COLUMNS) des données, à ne pas conserver."""
+        return np.frombuffer(self.data).reshape(-1, N_COLUMNS)
+
+    def slot(self, src_ip):
+        """Slot de `src_ip`, alloué si besoin (None si la table est pleine)."""
+        slot = self.slots.get(src_ip)
+        if slot is None:
+            if not self.free and not self._grow():
+                self.overflow += 1
+                return None
+            slot = self.free.pop()
+            self.slots[src_ip] = slot
+            self.ips[slot] = src_ip
+        return slot
+
+    def _release(self, slot):
+        del self.slots[self.ips[slot]]
+        self.ips[slot] = None
+        self.last_mac[slot] = None
+        self.free.append(slot)
+
+    # --------------------- Mise à jour par paquet ---------------------
+
+    def record_packet(self, src_ip, src_mac, t, size):
+        """
+        Compte un paquet de `size` octets reçu de `src_ip` à l'instant `t`.
+        Renvoie le slot de la source (None si la table est pleine).
+        """
+        slot = self.slot(src_ip)
+        if slot is None:
+            return None
+        d = self.data
+        i = slot * N_COLUMNS
+
+        last_mac = self.last_mac[slot]
+        if last_mac and last_mac != src_mac:
+            d[i + MAC_CHANGES] += 1
+        self.last_mac[slot] = src_mac
+
+        if d[i + PKT_COUNT]:
+            _welford(d, i + IAS_N, t - d[i + LAST_TIME])
+        else:
+            self.active.append(slot)
+            self.last_tick[slot] = self.tick
+            d[i + FIRST_TIME] = t
+        d[i + PKT_COUNT] += 1
+        d[i + BYTE_COUNT] += size
+        d[i + LAST_TIME] = t
+        _welford(d, i + SIZE_N, size)
+        return slot
+
+    def record_arp(self, slot, opcode):
+        if opcode == ARP_REQUEST:
+            self.data[slot * N_COLUMNS + ARP_REQ] += 1
+        elif opcode == ARP_REPLY:
+            self.data[slot * N_COLUMNS + ARP_REP] += 1
+
+    def record_ipv4(self, slot, dst_ip, ttl):
+        self.dst_ips.add(slot, dst_ip)
+        self.dst_ip_freq.add(slot, dst_ip)
+        _welford(self.data, slot * N_COLUMNS + TTL_N, ttl)
+
+    def record_tcp(self, slot, dst_port, syn, ack, fin, rst):
+        d = self.data
+        i = slot * N_COLUMNS
+        d[i + TCP_COUNT] += 1
+        d[i + FLOWS] += 1
+        self.dst_ports.add(slot, dst_port)
+        self.dst_port_freq.add(slot, dst_port)
+        if syn and not ack:
+            d[i + SYN_COUNT] += 1
+            d[i + INCOMPLETE_FLOWS] += 1
+        if ack:
+            d[i + ACK_COUNT] += 1
+        if fin:
+            d[i + FIN_COUNT] += 1
+        if rst:
+            d[i + RST_COUNT] += 1
+
+    def record_udp(self, slot, dst_port):
+        d = self.data
+        i = slot * N_COLUMNS
+        d[i + UDP_COUNT] += 1
+        d[i + FLOWS] += 1
+        self.dst_ports.add(slot, dst_port)
+        self.dst_port_freq.add(slot, dst_port)
+
+    # --------------------- Fenêtre ---------------------
+
+    def take(self):
+        """
+        Contenu des sources actives, pour un bucket de WindowRing (à appeler
+        juste avant reset) : (slots, lignes de la table, parts des colonnes
+        dst_ips, dst_ports, dst_ip_freq, dst_port_freq).
+        """
+        active = self.active
+        return (np.array(active, dtype=np.intp), self._matrix()[active],
+                self.dst_ips.take(active), self.dst_ports.take(active),
+                self.dst_ip_freq.take(active), self.dst_port_freq.take(active))
+
+    def reset(self):
+        """
+        Ouvre une nouvelle fenêtre : remet à zéro les sources actives (coût
+        proportionnel à leur nombre) et libère celles restées silencieuses
+        pendant `idle_ticks` resets.
+        """
+        active = self.active
+        if active:
+            self._matrix()[active] = 0.0
+            self.dst_ips.reset(active)
+            self.dst_ports.reset(active)
+            self.dst_ip_freq.reset(active)
+            self.dst_port_freq.reset(active)
+        self.history.append((self.tick, active))
+        self.active = []
+        self.tick += 1
+
+        while len(self.history) > self.idle_ticks:
+            tick, slots = self.history.popleft()
+            for slot in slots:
+                if self.last_tick[slot] == tick:
+                    self._release(slot)
+
+    def stats(self):
+        """Taille de la table (logs / suivi)."""
+        return {
+            "sources": len(self.slots),
+            "active": len(self.active),
+            "capacity": len(self.ips),
+            "overflow": self.overflow,
+        }
@@ -1,36 +1,417 @@
+"""
+Entraînement de l'Isolation Forest sur les features de collect_features.
+
+Les fichiers de /tmp/pox/features/ sont lus par morceaux, en un seul
+passage, sans jamais charger tout le jeu de données :
+  - le StandardScaler est calculé au fil des morceaux (partial_fit)
+  - un échantillon uniforme de --sample lignes est gardé (reservoir sampling)
+  - la forêt est entraînée sur cet échantillon normalisé, avec --jobs cœurs
+Le temps d'entraînement dépend donc de --sample, pas de la taille des
+fichiers. Le temps total et la mémoire maximale sont affichés à la fin.
+
+Les lignes des fenêtres d'attaque listées dans --labels (CSV
+src_ip,start,end, en secondes epoch) sont exclues de l'entraînement.
+
+Mode --sweep : chaque combinaison de n_estimators, max_samples et
+max_features est entraînée dans un pool de processus (taux de faux positifs
+sur du trafic normal mis de côté, taux de détection sur les fenêtres
+d'attaque), puis la latence d'un batch de --batch lignes avec le modèle
+compilé de forest_firewall est mesurée pour chacune, une à la fois, pool
+arrêté. Le meilleur modèle dont la latence tient dans --budget ms est exporté.
+
+  python3 ./ext/ml/train.py [--sample 200000] [--jobs -1]
+  python3 ./ext/ml/train.py --sweep --labels attacks.csv [--budget 20]
+"""
+import argparse
+import glob
+import itertools
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
-import joblib 
+
 DIR_TMP = "/tmp/pox/"
 DIR_FEATURES = DIR_TMP+ "features/"
 DIR_MODELS = DIR_TMP+ "models/"
-# Charger le dataset
-df = pd.read_csv(DIR_FEATURES+"pox_features.csv")
+MODEL_FILE = "iforest.pkl"  # (forêt, scaler), lu par forest_firewall (ml.utils.MODEL_PATH)
+
+WINDOW_SECONDS = 5.0    # fenêtre des features (celle de forest_firewall)
+CHUNK_ROWS = 100000     # lignes lues à la fois dans un CSV
+SAMPLE_ROWS = 200000    # taille de l'échantillon d'entraînement
+N_JOBS = -1             # cœurs utilisés par la forêt (-1 = tous)
+N_ESTIMATORS = 300
+CONTAMINATION = 0.001   # taux d'anomalies attendu
+
+# Mode --sweep
+SWEEP_ESTIMATORS = "50,100,300"
+SWEEP_MAX_SAMPLES = "256,1024"
+SWEEP_MAX_FEATURES = "0.5,1.0"
+VALIDATION_RATE = 0.2   # part du trafic normal gardée pour mesurer les faux positifs
+EVAL_ROWS = 50000       # lignes max par jeu d'évaluation (normal, attaques)
+LATENCY_BATCH = 256     # lignes d'un snapshot (sources par tick)
+LATENCY_BUDGET_MS = 20.0  # latence max d'évaluation d'un batch
+
+
+def feature_files(directory=DIR_FEATURES, window=WINDOW_SECONDS):
+    """
+    Fichiers de features de la fenêtre `window` (features-<durée>s-*) :
+    paquets .npz s'il y en a, sinon fichiers CSV. Les fichiers sans
+    fenêtre dans leur nom (anciennes collectes) ne sont pris qu'à défaut.
+    """
+    prefix = directory + "features-%gs-" % window
+    legacy = directory + "features-" + "[0-9]" * 8 + "-"
+    for pattern in (prefix + "*.npz", prefix + "*.csv",
+                    legacy + "*.npz", legacy + "*.csv", directory + "pox_features.csv"):
+        files = sorted(glob.glob(pattern))
+        if files:
+            return files
+    return []
+
+
+def iter_chunks(directory=DIR_FEATURES, chunk_rows=CHUNK_ROWS, window=WINDOW_SECONDS):
+    """
+    Morceaux (colonnes, timestamps, src_ips, X) des features écrites par
+    collect_features pour la fenêtre `window` :
+    paquets .npz (lus directement, sans analyse de texte), sinon fichiers
+    CSV lus par CHUNK_ROWS lignes. Lève ValueError si les colonnes
+    changent d'un fichier à l'autre.
+    """
+    columns = None
+    files = feature_files(directory, window)
+    if not files:
+        raise IOError("Aucune feature dans " + directory)
+    chunks = [f for f in files if f.endswith(".npz")]
+    if chunks:
+        for path in chunks:
+            with np.load(path) as chunk:
+                names = [str(c) for c in chunk["columns"]]
+                timestamps = chunk["timestamp"]
+                ips = chunk["src_ip"]
+                X = chunk["X"]
+            if columns is None:
+                columns = names
+            elif names != columns:
+                raise ValueError("Colonnes différentes dans " + path)
+            yield columns, timestamps, ips, X
+        return
+
+    for path in files:
+        for df in pd.read_csv(path, chunksize=chunk_rows):
+            timestamps = df["timestamp"].to_numpy(dtype=np.float64)
+            ips = df["src_ip"].to_numpy(dtype=str)
+            # Supprimer les colonnes inutiles (timestamp, src_ip)
+            df = df.drop(["timestamp", "src_ip"], axis=1)
+            if columns is None:
+                columns = list(df.columns)
+            elif list(df.columns) != columns:
+                raise ValueError("Colonnes différentes dans " + path)
+            yield columns, timestamps, ips, df.to_numpy(dtype=np.float64)
+
+
+def load_labels(path):
+    """Fenêtres d'attaque [(src_ip, début, fin)] d'un CSV src_ip,start,end."""
+    df = pd.read_csv(path)
+    return [(str(ip), float(start), float(end))
+            for ip, start, end in zip(df["src_ip"], df["start"], df["end"])]
+
+
+def attack_mask(labels, timestamps, ips):
+    """Lignes d'un morceau comprises dans une fenêtre d'attaque."""
+    mask = np.zeros(len(ips), dtype=bool)
+    for ip, start, end in labels:
+        mask |= (ips == ip) & (timestamps >= start) & (timestamps <= end)
+    return mask
+
+
+class Reservoir(object):
+    """Échantillon uniforme de `size` lignes d'un flux (algorithme R, par morceaux)."""
+
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.rows = None
+        self.seen = 0
+
+    def add(self, X):
+        if self.rows is None:
+            self.rows = np.empty((self.size, X.shape[1]))
+        # Début du flux : l'échantillon n'est pas encore plein
+        fill = min(len(X), max(self.size - self.seen, 0))
+        self.rows[self.seen:self.seen + fill] = X[:fill]
+        self.seen += fill
+        X = X[fill:]
+        if len(X):
+            # La ligne d'indice i remplace une ligne tirée dans [0, i] si
+            # le tirage tombe dans l'échantillon ; en cas de doublon la
+            # dernière affectation gagne, comme en séquentiel
+            j = self.rng.integers(0, np.arange(self.seen, self.seen + len(X)) + 1)
+            keep = j < self.size
+            self.rows[j[keep]] = X[keep]
+            self.seen += len(X)
+
+    def sample(self):
+        if self.rows is None:
+            return np.empty((0, 0))
+        return self.rows[:min(self.seen, self.size)]
+
+
+def peak_memory_mb():
+    """Mémoire résidente maximale du processus (ru_maxrss : Ko sous Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def dump(obj, path):
+    # Écriture dans un fichier temporaire puis renommage : forest_firewall
+    # recharge le modèle en marche et ne doit jamais lire un fichier incomplet
+    joblib.dump(obj, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def load_samples(directory=DIR_FEATURES, sample_rows=SAMPLE_ROWS, labels=(),
+                 validation=0.0, seed=42, window=WINDOW_SECONDS):
+    """
+    Un passage sur les fichiers. Renvoie le scaler (trafic normal) et les
+    échantillons normalisés : entraînement, normal mis de côté (part
+    `validation` du trafic normal) et attaques (fenêtres de `labels`).
+    """
+    scaler = StandardScaler()
+    rng = np.random.default_rng(seed)
+    train_rows = Reservoir(sample_rows, seed)
+    normal_rows = Reservoir(EVAL_ROWS, seed + 1)
+    attack_rows = Reservoir(EVAL_ROWS, seed + 2)
+    columns = None
+    for columns, timestamps, ips, X in iter_chunks(directory, window=window):
+        attack = attack_mask(labels, timestamps, ips)
+        if attack.any():
+            attack_rows.add(X[attack])
+            X = X[~attack]
+        held = rng.random(len(X)) < validation
+        if held.any():
+            normal_rows.add(X[held])
+            X = X[~held]
+        if not len(X):
+            continue
+        # DataFrame : le scaler garde le nom des colonnes (check_scaler_columns)
+        scaler.partial_fit(pd.DataFrame(X, columns=columns))
+        train_rows.add(X)
+    if not train_rows.seen:
+        raise ValueError("Aucune ligne de trafic normal dans " + directory)
+    print(f"{train_rows.seen + normal_rows.seen + attack_rows.seen} lignes lues, "
+          f"échantillon de {len(train_rows.sample())} lignes "
+          f"({normal_rows.seen} normales mises de côté, {attack_rows.seen} d'attaque)")
+
+    def scaled(reservoir):
+        if not reservoir.seen:
+            return np.empty((0, len(columns)))
+        return scaler.transform(pd.DataFrame(reservoir.sample(), columns=columns))
+
+    return scaler, scaled(train_rows), scaled(normal_rows), scaled(attack_rows)
+
+
+def fit_forest(X, n_estimators=N_ESTIMATORS, max_samples="auto", max_features=1.0,
+               n_jobs=N_JOBS, seed=42):
+    # Entraîner Isolation Forest
+    model = IsolationForest(
+        n_estimators=n_estimators,
+        max_samples=max_samples,
+        max_features=max_features,
+        contamination=CONTAMINATION,
+        n_jobs=n_jobs,
+        random_state=seed
+    )
+    model.fit(X)
+    return model
+
+
+def train(directory=DIR_FEATURES, sample_rows=SAMPLE_ROWS, n_jobs=N_JOBS, labels=(), seed=42,
+          window=WINDOW_SECONDS):
+    """Un passage sur les fichiers, puis entraînement : renvoie (modèle, scaler, échantillon)."""
+    scaler, X_scaled, _, _ = load_samples(directory, sample_rows, labels, seed=seed,
+                                          window=window)
+    model = fit_forest(X_scaled, n_jobs=n_jobs, seed=seed)
+    return model, scaler, X_scaled
+
+
+# --------------------- Mode --sweep ---------------------
+
+# Jeux de données des processus du sweep (envoyés une fois par processus)
+_sweep_data = None
+
+
+def _init_sweep(X_train, X_normal, X_attack):
+    global _sweep_data
+    _sweep_data = (X_train, X_normal, X_attack)
+
+
+def _parse_values(text):
+    """ "256,0.5,auto" -> [256, 0.5, "auto"] """
+    values = []
+    for item in text.split(","):
+        item = item.strip()
+        for kind in (int, float):
+            try:
+                values.append(kind(item))
+                break
+            except ValueError:
+                pass
+        else:
+            values.append(item)
+    return values
+
+
+def latency_ms(model, X, batch, repeat=5):
+    """Meilleur temps (ms) de predict sur un batch de `batch` lignes."""
+    X = np.resize(X, (batch, X.shape[1]))
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        model.predict(X)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e3
+
+
+def evaluate(params):
+    """
+    Exécuté dans un processus du pool : entraîne une configuration et
+    mesure faux positifs et détection (modèle compilé, comme dans le worker
+    de forest_firewall). Renvoie (résultat, modèle compilé) : la latence
+    est mesurée après, hors du pool (sweep).
+    """
+    from compiled import CompiledForest
+    X_train, X_normal, X_attack = _sweep_data
+    n_estimators, max_samples, max_features = params
+    t0 = time.perf_counter()
+    model = fit_forest(X_train, n_estimators, max_samples, max_features, n_jobs=1)
+    fit_time = time.perf_counter() - t0
+    compiled = CompiledForest(model)
+    fpr = (compiled.predict(X_normal) == -1).mean() if len(X_normal) else float("nan")
+    detection = (compiled.predict(X_attack) == -1).mean() if len(X_attack) else float("nan")
+    return {
+        "n_estimators": n_estimators,
+        "max_samples": max_samples,
+        "max_features": max_features,
+        "fpr": float(fpr),
+        "detection": float(detection),
+        "fit_s": fit_time,
+    }, compiled
+
+
+def best_result(results, budget_ms):
+    """
+    Meilleure configuration dans le budget de latence : détection la plus
+    haute, puis faux positifs les plus bas, puis la plus rapide.
+    None si aucune ne tient dans le budget.
+    """
+    def key(r):
+        detection = r["detection"] if r["detection"] == r["detection"] else 0.0
+        return (-detection, r["fpr"], r["latency_ms"])
+    eligible = [r for r in results if r["latency_ms"] <= budget_ms]
+    return min(eligible, key=key) if eligible else None
+
+
+def sweep(X_train, X_normal, X_attack, grid, budget_ms=LATENCY_BUDGET_MS,
+          batch=LATENCY_BATCH, processes=N_JOBS):
+    """
+    Évalue toutes les combinaisons de `grid` : entraînement, faux positifs
+    et détection en parallèle, puis latence mesurée une configuration à la
+    fois une fois le pool arrêté (machine au repos, sans les entraînements
+    des autres processus). Renvoie (résultats, meilleur).
+    """
+    if processes is None or processes < 1:
+        processes = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_sweep,
+                             initargs=(X_train, X_normal, X_attack)) as pool:
+        evaluated = list(pool.map(evaluate, itertools.product(*grid)))
+
+    X_latency = X_normal if len(X_normal) else X_train
+    results = []
+    for result, compiled in evaluated:
+        result["latency_ms"] = latency_ms(compiled, X_latency, batch)
+        results.append(result)
+
+    print(f"{'arbres':>7} {'max_samples':>11} {'max_feat':>8} {'faux pos.':>9} "
+          f"{'détection':>9} {'latence':>10} {'fit':>6}")
+    for r in results:
+        print(f"{r['n_estimators']:>7} {str(r['max_samples']):>11} {str(r['max_features']):>8} "
+              f"{r['fpr']:>9.4f} {r['detection']:>9.4f} {r['latency_ms']:>7.2f} ms "
+              f"{r['fit_s']:>5.1f}s")
+    return results, best_result(results, budget_ms)
+
 
-# Supprimer les colonnes inutiles (timestamp, src_ip)
-features = df.drop(["timestamp", "src_ip"], axis=1)
-# features = df.values
+def main():
+    parser = argparse.ArgumentParser(description="Entraînement de l'Isolation Forest")
+    parser.add_argument("--features", default=DIR_FEATURES,
+                        help="dossier des features (défaut : %(default)s)")
+    parser.add_argument("--models", default=DIR_MODELS,
+                        help="dossier du modèle (défaut : %(default)s)")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS,
+                        help="fenêtre des features, celle de forest_firewall "
+                             "(défaut : %(default)s s)")
+    parser.add_argument("--sample", type=int, default=SAMPLE_ROWS,
+                        help="lignes gardées pour l'entraînement (défaut : %(default)s)")
+    parser.add_argument("--jobs", type=int, default=N_JOBS,
+                        help="cœurs utilisés par la forêt, ou processus du sweep "
+                             "(défaut : %(default)s)")
+    parser.add_argument("--labels",
+                        help="CSV src_ip,start,end des fenêtres d'attaque")
+    parser.add_argument("--sweep", action="store_true",
+                        help="évalue une grille de paramètres et exporte le meilleur modèle")
+    parser.add_argument("--estimators", default=SWEEP_ESTIMATORS,
+                        help="sweep : valeurs de n_estimators (défaut : %(default)s)")
+    parser.add_argument("--max-samples", default=SWEEP_MAX_SAMPLES,
+                        help="sweep : valeurs de max_samples (défaut : %(default)s)")
+    parser.add_argument("--max-features", default=SWEEP_MAX_FEATURES,
+                        help="sweep : valeurs de max_features (défaut : %(default)s)")
+    parser.add_argument("--budget", type=float, default=LATENCY_BUDGET_MS,
+                        help="sweep : latence max d'un batch, en ms (défaut : %(default)s)")
+    parser.add_argument("--batch", type=int, default=LATENCY_BATCH,
+                        help="sweep : lignes par batch évalué (défaut : %(default)s)")
+    args = parser.parse_args()
 
-# Normalisation
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(features)
+    t0 = time.perf_counter()
+    labels = load_labels(args.labels) if args.labels else []
+    directory = os.path.join(args.features, "")
+    if args.sweep:
+        scaler, X_train, X_normal, X_attack = load_samples(
+            directory, args.sample, labels, validation=VALIDATION_RATE, window=args.window)
+        if not len(X_attack):
+            print("Aucune fenêtre d'attaque (--labels) : détection non mesurée")
+        grid = (_parse_values(args.estimators), _parse_values(args.max_samples),
+                _parse_values(args.max_features))
+        _, best = sweep(X_train, X_normal, X_attack, grid, args.budget, args.batch, args.jobs)
+        if best is None:
+            print(f"Aucune configuration ne tient dans le budget de {args.budget} ms : "
+                  f"modèle non exporté.")
+            return
+        print(f"Meilleure configuration : n_estimators={best['n_estimators']}, "
+              f"max_samples={best['max_samples']}, max_features={best['max_features']} "
+              f"({best['latency_ms']:.2f} ms par batch de {args.batch} lignes)")
+        # Même graine que dans le sweep : même forêt que celle évaluée
+        model = fit_forest(X_train, best["n_estimators"], best["max_samples"],
+                           best["max_features"], args.jobs)
+    else:
+        model, scaler, X_scaled = train(directory, args.sample, args.jobs, labels,
+                                        window=args.window)
 
-# Entraîner Isolation Forest
-model = IsolationForest(
-    n_estimators=300,
-    contamination=0.001,  # taux d'anomalies attendu
-    random_state=42
-)
+        y_pred = model.predict(X_scaled)
+        anom_count = (y_pred == -1).sum()
+        print(f"Faux positifs sur l'échantillon (trafic normal) : {anom_count}/{len(X_scaled)}")
 
-model.fit(X_scaled)
+    # Sauvegarder modèle + scaler dans un seul fichier : forest_firewall
+    # ne peut pas charger la nouvelle forêt avec l'ancien scaler
+    os.makedirs(args.models, exist_ok=True)
+    dump((model, scaler), os.path.join(args.models, MODEL_FILE))
 
-y_pred = model.predict(X_scaled)  
-anom_count = (y_pred == -1).sum()
-print(f"Faux positifs sur trafic normal : {anom_count}/{len(X_scaled)}")
+    print(f"Model sauvegardé dans le dossier {args.models}.")
+    print(f"Temps total : {time.perf_counter() - t0:.1f} s, "
+          f"mémoire max : {peak_memory_mb():.0f} Mo")
 
-# Sauvegarder modèle + scaler
-joblib.dump(model, DIR_MODELS+"iforest_model.pkl")
-joblib.dump(scaler, DIR_MODELS+"scaler.pkl")
 
-print(f"Model sauvegardé dans le dossier {DIR_MODELS}.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from collections import deque
+
+import numpy as np
+
+from .utils import BUCKET_SECONDS, FEATURE_COLUMNS
+from .state import (N_COLUMNS, SUM_COLUMNS, PKT_COUNT, SIZE_N, IAS_N, TTL_N,
+                    LAST_TIME, FIRST_TIME, fill_features)
+
+
+def merge_welford(A, col, nb, mb, m2b):
+    """
+    Fusionne ligne à ligne les agrégats de Welford [n, moyenne, M2] rangés
+    dans A à partir de la colonne `col` avec (nb, mb, m2b) (formule de
+    Chan et al.) :
+      n = na + nb, delta = mb - ma, moyenne = ma + delta * nb / n,
+      M2 = M2a + M2b + delta**2 * na * nb / n
+    """
+    na = A[:, col]
+    n = na + nb
+    delta = mb - A[:, col + 1]
+    w = np.divide(nb, n, out=np.zeros_like(n), where=n > 0)
+    A[:, col + 1] += delta * w
+    A[:, col + 2] += m2b + delta * delta * na * w
+    A[:, col] = n
+
+
+class WindowRing(object):
+    """
+    Fenêtres de plusieurs durées (ex. 1 s, 5 s, 30 s) calculées à partir
+    des mêmes données, sans revoir les paquets :
+      - la StateStore accumule un bucket de `bucket` secondes ; à chaque
+        close_bucket() ses sources actives sont rangées dans un anneau des
+        derniers buckets, puis elle est remise à zéro
+      - une fenêtre de k buckets fusionne les k derniers, un par un :
+        compteurs additionnés, agrégats de Welford fusionnés (avec les
+        temps inter-arrivées d'un bucket au suivant), sets / registres
+        HyperLogLog des destinations réunis, fréquences additionnées
+      - coût d'une fenêtre : k fusions vectorisées sur les sources actives
+        de chaque bucket, indépendant du nombre de paquets
+    Les taux (pkts_per_sec...) sont divisés par la durée de la fenêtre.
+    """
+
+    def __init__(self, store, bucket=BUCKET_SECONDS):
+        self.store = store
+        self.bucket = bucket
+        self.windows = {}           # durée (s) -> nombre de buckets
+        self.buckets = deque()      # derniers buckets (StateStore.take)
+        self.tick = 0
+        self._rows = np.zeros(0, dtype=np.intp)  # slot -> ligne du résultat
+        self._features = {}         # matrice réutilisée par fenêtre
+
+    def add_window(self, seconds):
+        """Ajoute une fenêtre de `seconds` secondes (multiple de `bucket`)."""
+        k = int(round(seconds / self.bucket))
+        if k < 1 or abs(k * self.bucket - seconds) > 1e-9:
+            raise ValueError("Fenêtre de %ss : pas un multiple du bucket de %ss"
+                             % (seconds, self.bucket))
+        self.windows[seconds] = k
+        # Une source n'est libérée (et son slot réutilisé) qu'une fois
+        # sortie de tous les buckets gardés
+        self.store.idle_ticks = max(self.store.idle_ticks, k)
+        return seconds
+
+    def close_bucket(self):
+        """
+        Ferme le bucket en cours. Renvoie les durées des fenêtres qui se
+        terminent avec lui (fenêtres alignées : celle de k buckets toutes
+        les k fermetures).
+        """
+        self.buckets.append(self.store.take())
+        self.store.reset()
+        keep = max(self.windows.values()) if self.windows else 1
+        while len(self.buckets) > keep:
+            self.buckets.popleft()
+        self.tick += 1
+        return sorted(s for s, k in self.windows.items() if self.tick % k == 0)
+
+    def features(self, seconds):
+        """
+        Features des sources actives pendant les `seconds` dernières
+        secondes : (liste des IP, matrice dans l'ordre de FEATURE_COLUMNS).
+        La matrice est réutilisée (et écrasée) au calcul suivant de la
+        même fenêtre.
+        """
+        store = self.store
+        parts = list(self.buckets)[-self.windows[seconds]:]
+        slots = np.unique(np.concatenate([p[0] for p in parts]))
+        n = len(slots)
+        if not n:
+            return [], np.empty((0, len(FEATURE_COLUMNS)))
+
+        # Ligne de chaque slot dans le résultat
+        if len(self._rows) < len(store.ips):
+            self._rows = np.zeros(len(store.ips), dtype=np.intp)
+        self._rows[slots] = np.arange(n)
+        rows = [self._rows[p[0]] for p in parts]
+
+        # Buckets fusionnés un par un, dans l'ordre chronologique
+        A = np.zeros((n, N_COLUMNS))
+        for r, part in zip(rows, parts):
+            if not len(r):
+                continue
+            D = part[1]
+            a = A[r]
+            seen = a[:, PKT_COUNT] > 0
+            # Temps inter-arrivées : écart entre le dernier paquet déjà vu
+            # et le premier du bucket, puis ceux du bucket
+            merge_welford(a, IAS_N, seen.astype(np.float64),
+                          np.where(seen, D[:, FIRST_TIME] - a[:, LAST_TIME], 0.0), 0.0)
+            for col in (IAS_N, SIZE_N, TTL_N):
+                merge_welford(a, col, D[:, col], D[:, col + 1], D[:, col + 2])
+            a[:, :SUM_COLUMNS] += D[:, :SUM_COLUMNS]
+            a[:, FIRST_TIME] = np.where(seen, a[:, FIRST_TIME], D[:, FIRST_TIME])
+            a[:, LAST_TIME] = D[:, LAST_TIME]
+            A[r] = a
+
+        dst_ips = store.dst_ips.merged_estimate(list(zip(rows, (p[2] for p in parts))), n)
+        dst_ports = store.dst_ports.merged_estimate(list(zip(rows, (p[3] for p in parts))), n)
+        entropy_dst_ips = store.dst_ip_freq.merged_entropy(
+            list(zip(rows, (p[4] for p in parts))), n, dst_ips)
+        entropy_dst_ports = store.dst_port_freq.merged_entropy(
+            list(zip(rows, (p[5] for p in parts))), n, dst_ports)
+
+        X = self._features.get(seconds)
+        if X is None or X.shape[0] < n:
+            X = self._features[seconds] = np.empty((max(n, 64), len(FEATURE_COLUMNS)))
+        X = X[:n]
+        fill_features(X, A, seconds, dst_ips, dst_ports, entropy_dst_ports, entropy_dst_ips)
+        ips = [store.ips[s] for s in slots.tolist()]
+        return ips, X
@@ -0,0 +1,217 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .utils import (load_model, model_version, check_scaler_columns, scale_features,
+                    FEATURE_COLUMNS)
+
+# Modèle et scaler du processus worker, et version du fichier chargé
+_model = None
+_scaler = None
+_version = None
+
+
+def _load():
+    """Charge (ou recharge) le modèle dans le worker."""
+    global _model, _scaler, _version
+    # sklearn n'est importé que dans le worker, pas au démarrage de POX
+    from .compiled import CompiledForest
+
+    # Version lue avant le chargement : un fichier remplacé entre les deux
+    # sera simplement rechargé à l'évaluation suivante
+    version = model_version()
+    model, scaler = load_model()
+    check_scaler_columns(scaler)
+    if getattr(model, "n_features_in_", len(FEATURE_COLUMNS)) != len(FEATURE_COLUMNS):
+        raise ValueError("La forêt attend %d colonnes, FEATURE_COLUMNS en a %d"
+                         % (model.n_features_in_, len(FEATURE_COLUMNS)))
+    # Forêt aplatie : mêmes prédictions que sklearn, sans son surcoût par appel
+    compiled = CompiledForest(model)
+    _model, _scaler, _version = compiled, scaler, version
+
+
+def _init():
+    """Démarrage du worker : le modèle peut ne pas encore exister."""
+    try:
+        _load()
+    except Exception:
+        pass
+
+
+def score(X):
+    """
+    Exécuté dans le worker : prédictions du modèle (-1 = anomalie).
+    Si le fichier du modèle a changé depuis le chargement, le nouveau
+    modèle est chargé avant l'évaluation ; en cas d'échec l'ancien est gardé.
+    Renvoie (prédictions, version du modèle utilisé, erreur de rechargement).
+    """
+    error = None
+    if model_version() != _version:
+        try:
+            _load()
+        except Exception as e:
+            if _model is None:
+                raise
+            error = e
+    return _model.predict(scale_features(X, _scaler)), _version, error
+
+
+class ScoringWorker(object):
+    """
+    Évalue les snapshots de features dans un processus séparé : la boucle
+    du contrôleur ne bloque jamais pendant predict.
+      - une seule évaluation à la fois : un snapshot qui arrive pendant une
+        évaluation est ignoré (compteur `skipped`)
+      - une évaluation plus longue que `timeout` secondes (worker bloqué)
+        est abandonnée au snapshot suivant : le worker est tué et relancé,
+        l'évaluation comptée en échec (`failed`)
+      - le résultat revient par `post(fonction, *args)` (core.callLater
+        dans POX) : les callbacks s'exécutent dans la boucle du contrôleur
+      - le délai snapshot -> verdict est mesuré (dernier, max, moyenne)
+      - le modèle est chargé dans le worker et rechargé quand son fichier
+        change (ml/train.py) : la forêt et le scaler, écrits dans le même
+        fichier, sont remplacés ensemble ; le nouveau modèle sert à partir de
+        l'évaluation suivante, sans redémarrer le contrôleur
+    """
+
+    def __init__(self, on_verdict, on_error, post, on_reload=None, clock=time.time,
+                 timeout=None):
+        """
+        on_verdict(ips, preds, delay) : prédictions d'un snapshot
+        on_error(ips, exception)      : échec de l'évaluation
+        post(fonction, *args)         : exécute fonction(*args) dans la boucle
+        on_reload(version, erreur)    : modèle (re)chargé, ou échec du rechargement
+        timeout                       : durée max d'une évaluation (None = sans limite)
+        """
+        self.on_verdict = on_verdict
+        self.on_error = on_error
+        self.post = post
+        self.on_reload = on_reload
+        self.clock = clock
+        self.timeout = timeout
+        self.executor = None
+        self.pending = None         # future de l'évaluation en cours
+        self._pending_since = 0.0
+        self._pending_ips = None
+        self.model_version = None
+        self.reloads = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.delay_last = 0.0
+        self.delay_max = 0.0
+        self.delay_total = 0.0
+
+        self._start()
+
+    def _start(self):
+        # spawn : le worker ne copie pas l'état (threads, sockets) de POX
+        self.executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init)
+        # Démarre le worker (et charge le modèle) sans attendre le 1er snapshot
+        self.executor.submit(int)
+
+    def _restart(self, kill=False):
+        # Worker mort (mémoire, signal...) ou bloqué (kill) : on en relance un.
+        # shutdown n'arrête pas une tâche en cours : le processus est tué
+        if kill:
+            for process in list(self.executor._processes.values()):
+                process.kill()
+        self.executor.shutdown(wait=False)
+        self._start()
+
+    def _expire(self):
+        """Abandonne l'évaluation en cours (trop longue) et relance le worker."""
+        ips = self._pending_ips
+        self.pending.cancel()
+        self.pending = None
+        self.failed += 1
+        self._restart(kill=True)
+        self.on_error(ips, TimeoutError("évaluation sans réponse depuis plus de %gs"
+                                        % self.timeout))
+
+    def submit(self, ips, X):
+        """
+        Envoie un snapshot au worker. Renvoie False (snapshot ignoré) si une
+        évaluation est déjà en cours.
+        """
+        t = self.clock()
+        if (self.pending is not None and self.timeout is not None
+                and t - self._pending_since > self.timeout):
+            self._expire()
+        if self.pending is not None:
+            self.skipped += 1
+            return False
+        # X est réutilisé par la fenêtre suivante : le worker en reçoit une copie
+        X = X.copy()
+        try:
+            future = self.executor.submit(score, X)
+        except BrokenProcessPool:
+            # Worker mort pendant qu'il attendait : relancé, puis nouvel essai
+            self._restart()
+            try:
+                future = self.executor.submit(score, X)
+            except BrokenProcessPool as e:
+                self.failed += 1
+                self.on_error(ips, e)
+                return False
+        self.pending = future
+        self._pending_since = t
+        self._pending_ips = ips
+        self.submitted += 1
+        future.add_done_callback(lambda f: self.post(self._done, ips, t, f))
+        return True
+
+    def _done(self, ips, t, future):
+        if future is not self.pending:
+            return      # évaluation abandonnée (_expire)
+        self.pending = None
+        self._pending_ips = None
+        try:
+            preds, version, reload_error = future.result()
+        except BrokenProcessPool as e:
+            self.failed += 1
+            self._restart()
+            self.on_error(ips, e)
+            return
+        except Exception as e:
+            self.failed += 1
+            self.on_error(ips, e)
+            return
+
+        if reload_error is not None or version != self.model_version:
+            if reload_error is None:
+                self.reloads += 1
+                self.model_version = version
+            if self.on_reload is not None:
+                self.on_reload(version, reload_error)
+
+        delay = self.clock() - t
+        self.completed += 1
+        self.delay_last = delay
+        self.delay_max = max(self.delay_max, delay)
+        self.delay_total += delay
+        self.on_verdict(ips, preds, delay)
+
+    def stats(self):
+        """Compteurs et délais snapshot -> verdict (secondes)."""
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "reloads": self.reloads,
+            "delay_last": self.delay_last,
+            "delay_max": self.delay_max,
+            "delay_avg": self.delay_total / self.completed if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        # cancel_futures n'existe qu'à partir de Python 3.9 (image : 3.8)
+        if self.pending is not None:
+            self.pending.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,4 @@
+#!/bin/bash
+set -e
+echo "Benchmark hors-ligne du pipeline default_firewall (PacketIn synthétiques)..."
+python3 pox.py bench_firewall --mix=all --packets=20000 log.level --ERROR
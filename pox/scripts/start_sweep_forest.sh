@@ -0,0 +1,5 @@
+#!/bin/bash
+set -e
+echo "Recherche des paramètres du modèle Isolation Forest (budget de latence)..."
+# Fenêtres d'attaque : CSV src_ip,start,end (secondes epoch)
+python3 ./ext/ml/train.py --sweep --labels "${1:-/tmp/pox/attacks.csv}" --budget "${2:-20}"